@@ -0,0 +1,188 @@
+"""
+This file contains the functions necessary for
+analysing the data of all sessions of the experiment at once.
+To run the 'colour categorisation' experiment, see main.py.
+
+Usage: python analysis.py <data directory> [--workers N] [--include-test]
+
+made by Anna van Harmelen, 2025
+"""
+
+import argparse
+import glob
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from participantinfo import get_session_owners
+from store import parse_trials
+
+N_ITERATIONS = 200
+TOLERANCE = 1e-6
+MAX_KAPPA = 500
+
+
+def find_sessions(directory, include_test=False):
+    # Map each session number to its data file
+    sessions = {}
+    for path in glob.glob(os.path.join(directory, "data_session_*.csv")):
+        match = re.fullmatch(r"data_session_(\d+)(_test)?\.csv", os.path.basename(path))
+        if match and (include_test or not match.group(2)):
+            sessions[int(match.group(1))] = path
+
+    return sessions
+
+
+def load_errors(paths):
+    data = parse_trials(
+        pd.concat(
+            [
+                pd.read_csv(
+                    path,
+                    usecols=lambda column: column
+                    in ["block_type", "target_colour", "selected_colour", "n_colours"],
+                )
+                for path in paths
+            ],
+            ignore_index=True,
+        )
+    )
+
+    # Signed response error in degrees, between -180 and 180
+    error_in_hues = data.selected_hue.to_numpy() - data.target_colour.to_numpy()
+    errors = (error_in_hues * 360 / data.n_colours.to_numpy() + 180) % 360 - 180
+
+    return data.block_type.to_numpy(), np.radians(errors)
+
+
+def a1_inverse(r):
+    # Approximate inverse of A1(kappa) = I1(kappa) / I0(kappa), see Fisher (1993)
+    r = np.clip(r, 0, 1 - 1e-9)
+    return np.where(
+        r < 0.53,
+        2 * r + r**3 + 5 * r**5 / 6,
+        np.where(
+            r < 0.85, -0.4 + 1.39 * r + 0.43 / (1 - r), 1 / (r**3 - 4 * r**2 + 3 * r)
+        ),
+    )
+
+
+def fit_mixture(errors, valid):
+    """
+    Fits a mixture of a von Mises and a uniform distribution to each row of
+    errors (in radians) at the same time, using expectation-maximisation.
+    Rows are conditions, padded to the same length; valid marks real trials.
+    """
+    n_trials = valid.sum(axis=1)
+    weights = valid.astype(float)
+
+    # Start from the plain circular mean, a broad distribution and half guesses
+    mu = np.arctan2(
+        (weights * np.sin(errors)).sum(1), (weights * np.cos(errors)).sum(1)
+    )
+    kappa = np.ones(len(errors))
+    guess_rate = np.full(len(errors), 0.5)
+
+    for _ in range(N_ITERATIONS):
+        # Expectation: probability that each response came from the von Mises
+        von_mises = np.exp(kappa[:, None] * np.cos(errors - mu[:, None])) / (
+            2 * np.pi * np.i0(kappa)[:, None]
+        )
+        in_memory = (1 - guess_rate[:, None]) * von_mises
+        weights = (
+            valid
+            * in_memory
+            / np.maximum(in_memory + guess_rate[:, None] / (2 * np.pi), 1e-300)
+        )
+
+        # Maximisation
+        total_weight = np.maximum(weights.sum(1), 1e-12)
+        sin_sum = (weights * np.sin(errors)).sum(1)
+        cos_sum = (weights * np.cos(errors)).sum(1)
+        new_guess_rate = 1 - total_weight / n_trials
+        mu = np.arctan2(sin_sum, cos_sum)
+        kappa = np.minimum(
+            a1_inverse(np.hypot(sin_sum, cos_sum) / total_weight), MAX_KAPPA
+        )
+
+        converged = np.all(np.abs(new_guess_rate - guess_rate) < TOLERANCE)
+        guess_rate = new_guess_rate
+        if converged:
+            break
+
+    return mu, kappa, guess_rate
+
+
+def analyse_participant(participant, paths):
+    block_types, errors = load_errors(paths)
+    conditions = np.unique(block_types)
+
+    # One row of (padded) errors per saturation level
+    n_max = max((block_types == condition).sum() for condition in conditions)
+    condition_errors = np.zeros((len(conditions), n_max))
+    valid = np.zeros((len(conditions), n_max), dtype=bool)
+    for i, condition in enumerate(conditions):
+        selected = errors[block_types == condition]
+        condition_errors[i, : len(selected)] = selected
+        valid[i, : len(selected)] = True
+
+    # Circular statistics
+    n_trials = valid.sum(1)
+    sin_mean = (valid * np.sin(condition_errors)).sum(1) / n_trials
+    cos_mean = (valid * np.cos(condition_errors)).sum(1) / n_trials
+    resultant_length = np.hypot(sin_mean, cos_mean)
+
+    mu, kappa, guess_rate = fit_mixture(condition_errors, valid)
+
+    return pd.DataFrame(
+        {
+            "participant_number": participant,
+            "block_type": conditions,
+            "n_trials": n_trials,
+            "mean_bias": np.degrees(np.arctan2(sin_mean, cos_mean)),
+            "circular_sd": np.degrees(np.sqrt(-2 * np.log(resultant_length))),
+            "mixture_mu": np.degrees(mu),
+            "mixture_kappa": kappa,
+            "guess_rate": guess_rate,
+        }
+    )
+
+
+def analyse(directory, workers=None, include_test=False):
+    sessions = find_sessions(directory, include_test)
+
+    # Find out which participant did each session
+    session_owner = get_session_owners(directory)
+
+    paths_per_participant = {}
+    for session, path in sorted(sessions.items()):
+        if session not in session_owner:
+            print(f"Skipping session {session}: not in the participant registry")
+            continue
+        paths_per_participant.setdefault(session_owner[session], []).append(path)
+
+    if not paths_per_participant:
+        return pd.DataFrame()
+
+    # Analyse every participant in a separate process
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(
+            analyse_participant,
+            paths_per_participant.keys(),
+            paths_per_participant.values(),
+        )
+
+        return pd.concat(results, ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("directory")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--include-test", action="store_true")
+    arguments = parser.parse_args()
+
+    results = analyse(arguments.directory, arguments.workers, arguments.include_test)
+    results.to_csv(os.path.join(arguments.directory, "analysis.csv"), index=False)
+    print(results.to_string(index=False))
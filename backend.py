@@ -0,0 +1,167 @@
+"""
+This file contains the functions necessary for
+choosing between a real PsychoPy display and a headless one,
+where a scripted observer plays the role of the participant.
+To run the 'colour categorisation' experiment, see main.py.
+
+made by Anna van Harmelen, 2025
+"""
+
+import random
+from math import cos, sin, radians
+from time import perf_counter
+from types import SimpleNamespace
+
+# Keys the scripted observer presses, in order of preference
+PREFERRED_KEYS = ["g", "space"]
+
+# Number of frames the scripted observer waits before moving and before clicking
+IDLE_FRAMES = 5
+RESPONSE_FRAMES = 30
+
+
+def get_backend(name):
+    if name == "psychopy":
+        from psychopy import visual, event, core
+        from psychopy.hardware.keyboard import Keyboard
+
+        return SimpleNamespace(visual=visual, event=event, core=core, Keyboard=Keyboard)
+
+    if name == "headless":
+        return SimpleNamespace(
+            visual=SimpleNamespace(
+                Window=HeadlessWindow,
+                Rect=HeadlessStim,
+                ShapeStim=HeadlessStim,
+                ImageStim=HeadlessStim,
+                TextStim=HeadlessStim,
+                CustomMouse=HeadlessStim,
+            ),
+            event=SimpleNamespace(Mouse=ScriptedMouse, waitKeys=wait_keys),
+            core=SimpleNamespace(
+                Clock=Clock, getTime=perf_counter, wait=skip_wait, quit=skip_quit
+            ),
+            Keyboard=ScriptedKeyboard,
+        )
+
+    raise ValueError("Backend must be 'psychopy' or 'headless'.")
+
+
+class HeadlessWindow:
+    """Window that draws nothing and flips as fast as possible."""
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+        self.n_flips = 0
+        self.n_draws = 0
+
+    def flip(self, clearBuffer=True):
+        self.n_flips += 1
+        return perf_counter()
+
+    def clearBuffer(self):
+        pass
+
+    def _getRegionOfFrame(self, rect=None, buffer="front", **kwargs):
+        # There are no pixels to read back
+        return None
+
+    def close(self):
+        pass
+
+
+class HeadlessStim:
+    """Any stimulus: keeps its properties, drawing only counts the draw."""
+
+    def __init__(self, win=None, **kwargs):
+        self.win = win
+        self.__dict__.update(kwargs)
+
+    def draw(self, win=None):
+        (win or self.win).n_draws += 1
+
+
+class ScriptedMouse:
+    """
+    Mouse that waits, sweeps around the colour wheel and then clicks. Like a
+    real mouse, every Mouse of a window reports the same pointer.
+    """
+
+    def __init__(self, visible=True, win=None):
+        self.visible = visible
+        self.win = win
+        if not hasattr(win, "pointer"):
+            win.pointer = SimpleNamespace(first_frame=None, angle=0, sweep=0)
+            self.new_response()
+
+    def new_response(self):
+        self.win.pointer.first_frame = None
+        self.win.pointer.angle = random.uniform(0, 360)
+        self.win.pointer.sweep = random.uniform(-3, 3)
+
+    def setVisible(self, visible):
+        # Showing the mouse starts a new response, also when it's reused
+        if visible and not self.visible:
+            self.new_response()
+        self.visible = visible
+
+    def frames_waited(self):
+        # Count flips, so polling the mouse more often doesn't speed things up
+        pointer = self.win.pointer
+        if pointer.first_frame is None:
+            pointer.first_frame = self.win.n_flips
+        return self.win.n_flips - pointer.first_frame
+
+    def mouseMoved(self):
+        return self.frames_waited() >= IDLE_FRAMES
+
+    def getPos(self):
+        angle = radians(
+            self.win.pointer.angle + self.win.pointer.sweep * self.frames_waited()
+        )
+        return 100 * cos(angle), 100 * sin(angle)
+
+    def getPressed(self):
+        return [self.frames_waited() >= IDLE_FRAMES + RESPONSE_FRAMES, False, False]
+
+
+class ScriptedKeyboard:
+    """Keyboard that never quits and answers every prompt immediately."""
+
+    def __init__(self):
+        self.clock = Clock()
+
+    def getKeys(self, keyList=None, **kwargs):
+        return []
+
+    def clearEvents(self):
+        pass
+
+
+class Clock:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._start = perf_counter()
+
+    def getTime(self):
+        return perf_counter() - self._start
+
+
+def wait_keys(keyList=None, **kwargs):
+    for key in PREFERRED_KEYS:
+        if key in keyList:
+            return [key]
+
+    return [keyList[0]]
+
+
+def skip_wait(secs, **kwargs):
+    # There's no participant to wait for
+    pass
+
+
+def skip_quit():
+    # Keep the process alive, so whoever started the session can report
+    pass
@@ -0,0 +1,61 @@
+"""
+This file contains the functions necessary for
+resuming a session that stopped before it was finished.
+To run the 'colour categorisation' experiment, see main.py.
+
+At the start of the blocks, the session's schedule is saved in
+journal_session_<n>.json. The trial data file already holds one row per
+finished trial, so together they say exactly where to continue: run
+main(resume=<session number>) to reload the schedule and append the
+remaining trials to the same file.
+
+made by Anna van Harmelen, 2025
+"""
+
+import json
+import os
+
+
+def get_journal_path(directory, session_name):
+    return os.path.join(directory, f"journal_session_{session_name}.json")
+
+
+def write_journal(path, journal: dict):
+    # Write a new file first and swap it in, so there's never half a journal
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as file:
+        json.dump(journal, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_path, path)
+
+
+def load_journal(path):
+    if not os.path.exists(path):
+        raise Exception(
+            f"Can't resume this session, there's no journal at {path}. "
+            "Sessions can only be resumed once their blocks have started."
+        )
+
+    with open(path) as file:
+        journal = json.load(file)
+
+    # Blocks are saved as lists, the experiment expects (type, colours) tuples
+    journal["blocks"] = [tuple(block) for block in journal["blocks"]]
+
+    return journal
+
+
+def count_completed_trials(csv_path):
+    if not os.path.exists(csv_path):
+        return 0
+
+    # A crash while writing can leave half a row, which is removed
+    with open(csv_path, "rb+") as file:
+        data = file.read()
+        if data and not data.endswith(b"\n"):
+            data = data[: data.rfind(b"\n") + 1]
+            file.truncate(len(data))
+
+    # Every line after the header is a finished trial
+    return max(data.count(b"\n") - 1, 0)
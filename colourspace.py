@@ -0,0 +1,176 @@
+"""
+This file contains the functions necessary for
+converting the colours of the experiment to the monitor's RGB values.
+To run the 'colour categorisation' experiment, see main.py.
+
+Colours are identified by their [hue, saturation, value] everywhere in the
+experiment, but drawn with a lookup table of RGB values per hue, computed
+once per saturation level:
+ - "cielab": a circle in CIELAB at fixed lightness L*, so colours are equally
+   far apart perceptually; the saturation level is the fraction of the largest
+   chroma at which the whole circle fits on the monitor
+ - "hsv": the same colours PsychoPy would draw for colorSpace="hsv"
+For "cielab", set monitor["calibration"] to the measured chromaticities of
+the monitor's primaries and white point, and its gamma. Tables are cached on
+disk per calibration.
+
+made by Anna van Harmelen, 2025
+"""
+
+import hashlib
+import json
+import os
+import numpy as np
+
+# Lightness of the colour circle
+L_STAR = 50
+
+# Used when the monitor hasn't been calibrated
+SRGB_CALIBRATION = {
+    "primaries": [[0.64, 0.33], [0.30, 0.60], [0.15, 0.06]],  # red, green, blue (x, y)
+    "white": [0.3127, 0.3290],  # x, y
+    "gamma": 2.2,
+}
+
+# Tables that have already been computed
+_colour_tables = {}
+
+
+def hsv_to_rgb(hsv):
+    # Same conversion PsychoPy applies for colorSpace="hsv", but on whole arrays
+    hsv = np.asarray(hsv, dtype=float)
+    hue = (hsv[..., 0] % 360) / 60
+    chroma = hsv[..., 1] * hsv[..., 2]
+    x = chroma * (1 - np.abs(hue % 2 - 1))
+    zero = np.zeros_like(chroma)
+
+    sector = np.floor(hue).astype(int) % 6
+    red = np.choose(sector, [chroma, x, zero, zero, x, chroma])
+    green = np.choose(sector, [x, chroma, chroma, x, zero, zero])
+    blue = np.choose(sector, [zero, zero, x, chroma, chroma, x])
+    rgb = np.stack([red, green, blue], axis=-1) + (hsv[..., 2] - chroma)[..., None]
+
+    # Scale from 0:1 to PsychoPy's -1:1
+    return rgb * 2 - 1
+
+
+def xy_to_xyz(xy):
+    # Chromaticity to XYZ with a luminance of 1
+    x, y = np.asarray(xy, dtype=float).T
+    return np.stack([x / y, np.ones_like(x), (1 - x - y) / y], axis=-1)
+
+
+def rgb_to_xyz_matrix(calibration):
+    # Scale the primaries so that full red, green and blue add up to white
+    primaries = xy_to_xyz(calibration["primaries"]).T
+    scale = np.linalg.solve(primaries, xy_to_xyz(calibration["white"]))
+    return primaries * scale
+
+
+def lab_to_linear_rgb(lab, calibration):
+    # CIELAB relative to the monitor's white, to linear RGB from 0 to 1
+    lightness, a, b = np.moveaxis(np.asarray(lab, dtype=float), -1, 0)
+    fy = (lightness + 16) / 116
+    f = np.stack([fy + a / 500, fy, fy - b / 200], axis=-1)
+    delta = 6 / 29
+    relative_xyz = np.where(f > delta, f**3, 3 * delta**2 * (f - 4 / 29))
+    xyz = relative_xyz * xy_to_xyz(calibration["white"])
+
+    return xyz @ np.linalg.inv(rgb_to_xyz_matrix(calibration)).T
+
+
+def max_chroma(lightness, calibration, n_hues=360, resolution=0.1):
+    # Largest chroma at which the circle of all hues fits within the monitor's gamut
+    chromas = np.arange(0, 200, resolution)
+    angles = np.radians(np.arange(n_hues) * 360 / n_hues)
+    lab = np.stack(
+        np.broadcast_arrays(
+            lightness,
+            chromas[:, None] * np.cos(angles),
+            chromas[:, None] * np.sin(angles),
+        ),
+        axis=-1,
+    )
+    rgb = lab_to_linear_rgb(lab, calibration)
+    in_gamut = ((rgb >= 0) & (rgb <= 1)).all(axis=(1, 2))
+
+    # The gamut is convex, so the first chroma that doesn't fit is the limit
+    return chromas[np.argmin(in_gamut) - 1] if not in_gamut.all() else chromas[-1]
+
+
+def create_colour_table(n_colours, saturation, colour_space, calibration):
+    # Hue ids are spread evenly over the 360 degrees of the colour circle
+    hues = np.arange(n_colours) * 360 / n_colours
+
+    if colour_space == "hsv":
+        return hsv_to_rgb(
+            np.stack(
+                [hues, np.full(n_colours, saturation), np.full(n_colours, 0.5)],
+                axis=-1,
+            )
+        ).astype(np.float32)
+
+    if colour_space != "cielab":
+        raise ValueError("Colour space must be 'cielab' or 'hsv'.")
+
+    chroma = saturation * max_chroma(L_STAR, calibration)
+    lab = np.stack(
+        [
+            np.full(n_colours, L_STAR),
+            chroma * np.cos(np.radians(hues)),
+            chroma * np.sin(np.radians(hues)),
+        ],
+        axis=-1,
+    )
+    linear_rgb = np.clip(lab_to_linear_rgb(lab, calibration), 0, 1)
+
+    # Undo the monitor's gamma, and scale from 0:1 to PsychoPy's -1:1
+    rgb = linear_rgb ** (1 / calibration["gamma"])
+    return (rgb * 2 - 1).astype(np.float32)
+
+
+def get_calibration(monitor):
+    return monitor.get("calibration", SRGB_CALIBRATION)
+
+
+def calibration_hash(calibration):
+    # The same for a calibration read back from a journal, where tuples are lists
+    return hashlib.sha1(
+        json.dumps(calibration, sort_keys=True).encode()
+    ).hexdigest()[:12]
+
+
+def colour_table_name(n_colours, saturation, settings):
+    # Name that changes whenever anything that changes the table does
+    calibration = calibration_hash(get_calibration(settings["monitor"]))
+    return f"{settings['colour_space']}_{n_colours}_{saturation}_{calibration}"
+
+
+def load_colour_table(n_colours, saturation, settings):
+    """
+    Returns the RGB values (-1 to 1) of hues 0 to n_colours - 1 at the given
+    saturation (0 to 1), with shape (n_colours, 3).
+    """
+    name = colour_table_name(n_colours, saturation, settings)
+    if name in _colour_tables:
+        return _colour_tables[name]
+
+    # Try to load a table computed in an earlier session
+    cache_file = os.path.join(
+        settings["directory"], "cache", f"colour_table_{name}.npy"
+    )
+    if os.path.exists(cache_file):
+        _colour_tables[name] = np.load(cache_file)
+        return _colour_tables[name]
+
+    table = create_colour_table(
+        n_colours,
+        saturation,
+        settings["colour_space"],
+        get_calibration(settings["monitor"]),
+    )
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    np.save(cache_file, table)
+
+    _colour_tables[name] = table
+    return table
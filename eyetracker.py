@@ -0,0 +1,211 @@
+"""
+This file contains the functions necessary for
+recording gaze and sending triggers to the eyetracker.
+To run the 'colour categorisation' experiment, see main.py.
+
+The experiment only ever puts triggers in a queue; a background thread
+sends them to the tracker, collects its gaze samples in a ring buffer and
+writes both to eyetracker_session_<n>.bin (EYE_DTYPE records, where kind is
+0 for gaze samples and the trigger code otherwise). MockTracker produces
+synthetic samples, so all of this runs without an eyetracker.
+
+made by Anna van Harmelen, 2025
+"""
+
+import os
+import threading
+from collections import deque
+from time import sleep
+import numpy as np
+
+EYE_DTYPE = np.dtype(
+    [("time", "f8"), ("kind", "u1"), ("x", "f4"), ("y", "f4"), ("pupil", "f4")]
+)
+
+TRIGGERS = {
+    "trial_start": 1,
+    "wheel_onset": 2,
+    "movement_onset": 3,
+    "response": 4,
+    "feedback": 5,
+    "break": 6,
+}
+
+# Gaze samples kept in memory, about a minute at 1000 Hz
+BUFFER_SIZE = 2**16
+
+# How often the tracker is read, in seconds, and how many records to collect
+# before writing them to disk
+POLL_PERIOD = 0.005
+SAVE_SIZE = 2**12
+
+
+class MockTracker:
+    """
+    Stands in for an eyetracker: looks at the centre of the screen with some
+    noise, at a fixed sampling rate.
+    """
+
+    def __init__(self, clock, rate=1000, seed=None):
+        self.clock = clock
+        self.rate = rate
+        self.rng = np.random.default_rng(seed)
+        self.recording = False
+        self.triggers = []
+        self._last_sample = None
+
+    def calibrate(self):
+        pass
+
+    def start_recording(self):
+        self.recording = True
+        self._last_sample = self.clock()
+
+    def stop_recording(self):
+        self.recording = False
+
+    def send_trigger(self, code, time):
+        self.triggers.append((time, code))
+
+    def get_samples(self):
+        # All samples taken since the previous call
+        n_samples = int((self.clock() - self._last_sample) * self.rate)
+        samples = np.zeros(n_samples, dtype=EYE_DTYPE)
+        samples["time"] = self._last_sample + np.arange(1, n_samples + 1) / self.rate
+        samples["x"] = self.rng.normal(0, 10, n_samples)
+        samples["y"] = self.rng.normal(0, 10, n_samples)
+        samples["pupil"] = self.rng.normal(3, 0.1, n_samples)
+        if n_samples:
+            self._last_sample = samples["time"][-1]
+
+        return samples
+
+
+# Trackers that can be chosen with settings["eyetracking"]
+TRACKERS = {"mock": MockTracker}
+
+
+class Eyetracker:
+    """
+    Wraps a tracker so the experiment never waits for it: triggers are queued
+    and gaze is read, buffered and saved by a background thread.
+    """
+
+    def __init__(self, tracker, directory, session, clock, buffer_size=BUFFER_SIZE):
+        self.tracker = tracker
+        self.clock = clock
+        self.path = os.path.join(directory, f"eyetracker_session_{session}.bin")
+        self.n_dropped = 0
+
+        # Records ever put in the buffer, and how many of those are on disk
+        self._buffer = np.zeros(buffer_size, dtype=EYE_DTYPE)
+        self._n_buffered = 0
+        self._n_saved = 0
+
+        self._triggers = deque()
+        self._latest_gaze = None
+        self._recording = False
+        self._closing = False
+        self._lock = threading.Lock()
+
+        self._file = open(self.path, "ab")
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def calibrate(self):
+        # Calibrating takes over the tracker, so recording stops until start()
+        self.stop()
+        with self._lock:
+            self.tracker.calibrate()
+
+    def start(self):
+        with self._lock:
+            self.tracker.start_recording()
+            self._recording = True
+
+    def stop(self):
+        with self._lock:
+            self._recording = False
+            self.tracker.stop_recording()
+
+    def trigger(self, name, time=None):
+        # Only queues the trigger, so this is safe to call right after a flip
+        self._triggers.append((self.clock() if time is None else time, TRIGGERS[name]))
+
+    def latest_gaze(self):
+        # Most recent gaze sample, or None if there isn't one yet
+        return self._latest_gaze
+
+    def close(self):
+        self.stop()
+        self._closing = True
+        self._thread.join()
+        self._file.close()
+
+    def _run(self):
+        while not self._closing:
+            self._poll()
+            if self._n_buffered - self._n_saved >= SAVE_SIZE:
+                self._save()
+            sleep(POLL_PERIOD)
+
+        # Keep everything that came in before closing
+        self._poll()
+        self._save()
+
+    def _poll(self):
+        with self._lock:
+            if self._recording:
+                samples = self.tracker.get_samples()
+                self._put(samples)
+                if len(samples):
+                    self._latest_gaze = samples[-1].copy()
+
+            while self._triggers:
+                time, code = self._triggers.popleft()
+                self.tracker.send_trigger(code, time)
+                trigger = np.zeros(1, dtype=EYE_DTYPE)
+                trigger["time"] = time
+                trigger["kind"] = code
+                for field in ["x", "y", "pupil"]:
+                    trigger[field] = np.nan
+                self._put(trigger)
+
+    def _put(self, records):
+        # Write the records at the end of the ring buffer, wrapping around
+        size = len(self._buffer)
+        positions = (self._n_buffered + np.arange(len(records))) % size
+        self._buffer[positions] = records
+        self._n_buffered += len(records)
+
+        # Records that were overwritten before they were saved are lost
+        if self._n_buffered - self._n_saved > size:
+            self.n_dropped += self._n_buffered - self._n_saved - size
+            self._n_saved = self._n_buffered - size
+
+    def _save(self):
+        size = len(self._buffer)
+        positions = np.arange(self._n_saved, self._n_buffered) % size
+        self._buffer[positions].tofile(self._file)
+        self._file.flush()
+        self._n_saved = self._n_buffered
+
+
+def create_eyetracker(name, directory, session, clock):
+    if name not in TRACKERS:
+        raise Exception(
+            f"Unknown eyetracker '{name}', expected one of: {', '.join(TRACKERS)}."
+        )
+
+    return Eyetracker(TRACKERS[name](clock), directory, session, clock)
+
+
+def load_eye_data(directory, session):
+    # Split the session's file into gaze samples and triggers
+    records = np.fromfile(
+        os.path.join(directory, f"eyetracker_session_{session}.bin"), dtype=EYE_DTYPE
+    )
+    gaze = records[records["kind"] == 0]
+    triggers = records[records["kind"] != 0][["time", "kind"]]
+
+    return gaze, triggers
@@ -0,0 +1,152 @@
+"""
+This file contains the functions necessary for
+showing the experimenter how the session is going, from another process.
+To run the 'colour categorisation' experiment, see main.py.
+
+After every trial, the experiment sends its results, running statistics per
+saturation level and the frame timing so far as one UDP packet to a port on
+this computer. Sending never waits: when no viewer is listening, the packet
+is simply lost. To watch a session, run in a second terminal:
+
+Usage: python feed.py [--port N]
+
+made by Anna van Harmelen, 2025
+"""
+
+import argparse
+import json
+import socket
+
+FEED_PORT = 50507
+
+
+class RunningStats:
+    """Mean and standard deviation, updated one value at a time (Welford)."""
+
+    __slots__ = ("n", "mean", "_sum_of_squares")
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self._sum_of_squares = 0.0
+
+    def update(self, value):
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self._sum_of_squares += delta * (value - self.mean)
+
+    @property
+    def sd(self):
+        return (self._sum_of_squares / (self.n - 1)) ** 0.5 if self.n > 1 else 0.0
+
+
+class SessionFeed:
+    """Keeps the running statistics of a session and sends them after each trial."""
+
+    def __init__(self, session, port=FEED_PORT):
+        self.session = session
+        self.address = ("127.0.0.1", port)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+
+        self.performance = {}
+        self.response_time = {}
+        self.block_performance = RunningStats()
+        self.n_frames = 0
+        self.n_dropped_frames = 0
+        self.max_frame_interval = 0.0
+
+    def start_block(self):
+        self.block_performance = RunningStats()
+
+    def trial_done(self, trial_number, block, block_type, report):
+        self.performance.setdefault(block_type, RunningStats()).update(
+            report["performance"]
+        )
+        self.response_time.setdefault(block_type, RunningStats()).update(
+            report["response_time_in_ms"]
+        )
+        self.block_performance.update(report["performance"])
+        self.n_frames += report["n_frames"]
+        self.n_dropped_frames += report["n_dropped_frames"]
+        self.max_frame_interval = max(
+            self.max_frame_interval, report["max_frame_interval_in_ms"]
+        )
+
+        self.send(
+            {
+                "session": self.session,
+                "trial_number": trial_number,
+                "block": block,
+                "block_type": block_type,
+                "performance": report["performance"],
+                "block_performance": self.block_performance.mean,
+                "saturation_levels": {
+                    kind: {
+                        "n_trials": stats.n,
+                        "mean_performance": stats.mean,
+                        "sd_performance": stats.sd,
+                        "mean_response_time_in_ms": self.response_time[kind].mean,
+                    }
+                    for kind, stats in self.performance.items()
+                },
+                "n_frames": self.n_frames,
+                "n_dropped_frames": self.n_dropped_frames,
+                "max_frame_interval_in_ms": self.max_frame_interval,
+            }
+        )
+
+    def send(self, message: dict):
+        # Never wait for the viewer, and carry on when there isn't one
+        try:
+            self.socket.sendto(json.dumps(message).encode(), self.address)
+        except OSError:
+            pass
+
+    def close(self):
+        self.socket.close()
+
+
+def show(message):
+    # Redraw the whole terminal with the latest state of the session
+    lines = [
+        f"Session {message['session']}, trial {message['trial_number']}, "
+        f"block {message['block']} ({message['block_type']})",
+        f"Last score: {message['performance']}, "
+        f"block average: {message['block_performance']:.1f}",
+        "",
+        f"{'saturation':<12}{'trials':>8}{'score':>10}{'sd':>8}{'RT (ms)':>10}",
+    ]
+    for kind, stats in message["saturation_levels"].items():
+        lines.append(
+            f"{kind:<12}{stats['n_trials']:>8}{stats['mean_performance']:>10.1f}"
+            f"{stats['sd_performance']:>8.1f}{stats['mean_response_time_in_ms']:>10.0f}"
+        )
+
+    dropped = message["n_dropped_frames"] / max(message["n_frames"], 1) * 100
+    lines.append("")
+    lines.append(
+        f"Frames: {message['n_frames']}, dropped: {message['n_dropped_frames']} "
+        f"({dropped:.2f}%), longest: {message['max_frame_interval_in_ms']:.1f} ms"
+    )
+
+    print("\033[2J\033[H" + "\n".join(lines), flush=True)
+
+
+def view(port=FEED_PORT):
+    viewer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    viewer.bind(("127.0.0.1", port))
+    print(f"Waiting for a session on port {port}...")
+
+    while True:
+        data, _ = viewer.recvfrom(65536)
+        show(json.loads(data))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=FEED_PORT)
+    arguments = parser.parse_args()
+
+    view(arguments.port)
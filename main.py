@@ -5,124 +5,298 @@ made by Anna van Harmelen, 2025
 see README.md for instructions if needed
 """
 
-# Import necessary stuff
+# Import necessary stuff, timing how long that takes
+from time import perf_counter
+
+imports_started = perf_counter()
+import gc
+import os
 import traceback
-from psychopy import core, event
-import pandas as pd
-from participantinfo import get_participant_details
-from set_up import get_monitor_and_dir, get_settings
+from participantinfo import (
+    open_registry,
+    get_participant_details,
+    get_session_participant,
+    update_trials_completed,
+)
+from set_up import get_monitor_and_dir, get_settings, warm_up
 from practice import practice
 from time import time
-from numpy import mean
 from practice import practice
 import datetime as dt
 from block import (
     create_block_list,
     block_break,
     long_break,
+    welcome_back,
     finish,
     quick_finish,
 )
 from trial import single_trial
+from writer import TrialWriter
+from trajectory import MouseSampler
+from eyetracker import create_eyetracker
+from feed import RunningStats, SessionFeed
+from plan import load_plan, get_trials, get_block_starts
+from colourspace import get_calibration
+from checkpoint import (
+    get_journal_path,
+    write_journal,
+    load_journal,
+    count_completed_trials,
+)
+
+IMPORT_TIME = perf_counter() - imports_started
 
 N_BLOCKS = 24
 TRIALS_PER_BLOCK = 45
 
 
-def main():
+def main(
+    testing=True,
+    backend="psychopy",
+    directory=None,
+    test_blocks=2,
+    profile=False,
+    eyetracking=None,
+    resume=None,
+):
     """
     Data formats / storage:
-     - eyetracking data saved in one .edf file per session
+     - eyetracking data saved in one .bin file per session, see eyetracker.py
      - all trial data saved in one .csv per session
-     - subject data in one .csv (for all sessions combined)
-    """
+     - the schedule of each session in one .json journal, see checkpoint.py
+     - subject data in participantinfo.db (for all sessions combined)
 
-    # Set whether this is a test run or not
-    testing = True
+    Arguments:
+     - testing: whether this is a test run or not
+     - backend: "psychopy", or "headless" to run without screen, mouse and keyboard
+     - directory: data directory to use instead of the default one
+     - test_blocks: number of blocks to run when testing, None for all of them
+     - profile: whether to time each phase of the trials and print a report
+     - eyetracking: None, or the eyetracker to use ("mock" for synthetic gaze)
+     - resume: number of a session that stopped early, to continue it
+    """
 
     # Get monitor and directory information
-    monitor, directory = get_monitor_and_dir(testing)
-
-    # Get participant details and save in same file as before
-    old_participants = pd.read_csv(
-        rf"{directory}\participantinfo.csv",
-        dtype={
-            "participant_number": int,
-            "session_number": int,
-            "age": int,
-            "trials_completed": str,
-        },
-    )
-    new_participants = get_participant_details(old_participants, testing)
+    monitor, default_directory = get_monitor_and_dir(testing)
+    directory = directory or default_directory
+
+    # Moment at which each stage of the start-up ended
+    startup = [("start", perf_counter())]
+
+    # Get participant details and register this session, or continue one
+    registry = open_registry(directory)
+    startup.append(("registry", perf_counter()))
+    if resume:
+        participant, session = get_session_participant(registry, resume), resume
+    else:
+        participant, session = get_participant_details(registry, testing)
+    startup.append(("participant_details", perf_counter()))
+    session_name = f"{session}{'_test' if testing else ''}"
+    data_path = os.path.join(directory, f"data_session_{session_name}.csv")
+    journal_path = get_journal_path(directory, session_name)
 
     # Initialise set-up
-    settings = get_settings(monitor, directory)
+    settings = get_settings(monitor, directory, backend, profile, eyetracking)
     settings["keyboard"].clearEvents()
+    startup.append(("settings", perf_counter()))
+
+    if resume:
+        # Same schedule as before, without the trials that are already done
+        journal = load_journal(journal_path)
+        blocks = journal["blocks"]
+        settings["n_colours"] = journal["n_colours"]
+        settings["colour_space"] = journal.get("colour_space", settings["colour_space"])
+        n_completed = count_completed_trials(data_path)
+    else:
+        # Create a list of blocks, each containing a list of trials
+        blocks = create_block_list(
+            N_BLOCKS, TRIALS_PER_BLOCK, settings["n_colours"], session, directory
+        )
+        if testing:
+            blocks = blocks[:test_blocks]
+        n_completed = 0
+    startup.append(("schedule", perf_counter()))
+
+    # Plan every trial, so the trials themselves draw no random numbers
+    plan = load_plan(directory, session_name, blocks, settings["n_colours"], session)
+    practice_trials, trials = get_trials(plan)
+    block_starts = get_block_starts(plan)
+    startup.append(("plan", perf_counter()))
 
-    # Practice until participant wants to stop
-    practice(settings)
+    # Draw everything once, so the first trials aren't slower than the rest
+    warm_up(settings)
+    startup.append(("warm_up", perf_counter()))
+
+    # Report how long each stage of the start-up took
+    startup_times = {"imports": IMPORT_TIME}
+    for (_, started), (stage, ended) in zip(startup, startup[1:]):
+        startup_times[stage] = ended - started
+    for stage, seconds in startup_times.items():
+        settings["profiler"].record(("startup", stage), seconds)
+    print(
+        "Start-up: "
+        + ", ".join(
+            f"{stage} {seconds:.2f} s" for stage, seconds in startup_times.items()
+        )
+    )
+
+    # Everything made so far lives for the whole session, so take it out of
+    # the garbage collector's sight and only collect during feedback and breaks
+    if settings["gc_control"]:
+        gc.collect()
+        gc.freeze()
+        gc.disable()
+
+    # First trial that's left to do
+    first_trial = trials[n_completed] if n_completed < len(trials) else None
+
+    if resume:
+        # Times keep counting from the original start of the experiment
+        welcome_back(settings, first_trial)
+        start_of_experiment = journal["start_of_experiment"]
+    else:
+        # Practice until participant wants to stop
+        practice(settings, practice_trials, first_trial)
+        start_of_experiment = time()
+
+        # Save the schedule, so the session can be resumed if it stops early
+        write_journal(
+            journal_path,
+            {
+                "participant_number": participant,
+                "session_number": session,
+                "testing": testing,
+                "start_of_experiment": start_of_experiment,
+                "n_colours": settings["n_colours"],
+                "colour_space": settings["colour_space"],
+                "calibration": get_calibration(settings["monitor"]),
+                "blocks": blocks,
+            },
+        )
 
     # Initialise some stuff
-    start_of_experiment = time()
-    data = []
-    current_trial = 0
+    current_trial = n_completed
     finished_early = True
-    mouse = event.Mouse(visible=False, win=settings["window"])
+
+    # Trial data is appended to this file while the experiment runs
+    writer = TrialWriter(data_path, n_completed)
+
+    # Record the mouse trajectory of every response, with a mouse of its own
+    if settings["record_trajectories"]:
+        settings["sampler"] = MouseSampler(
+            settings["directory"],
+            session_name,
+            settings["core"].getTime,
+            settings["event"].Mouse(visible=False, win=settings["window"]),
+            settings["mouse_sample_rate"],
+            n_completed,
+        )
+
+    # Record gaze during the blocks, with a trigger at each event of a trial
+    if settings["eyetracking"]:
+        settings["eyetracker"] = create_eyetracker(
+            settings["eyetracking"],
+            settings["directory"],
+            session_name,
+            settings["core"].getTime,
+        )
+        settings["eyetracker"].calibrate()
+        settings["eyetracker"].start()
+    eyetracker = settings["eyetracker"]
+
+    # Let the experimenter follow the session from another process (feed.py)
+    feed = (
+        SessionFeed(session_name, settings["feed_port"])
+        if settings["feed_port"]
+        else None
+    )
 
     # Start experiment
+    settings["profiler"].start_blocks()
     try:
-        # Create a list of blocks, each containing a list of trials
-        blocks = create_block_list(N_BLOCKS, TRIALS_PER_BLOCK, settings["n_colours"])
+        for block_number in range(1, len(block_starts)):
+            # Skip the trials that were done before resuming
+            first = max(block_starts[block_number - 1], n_completed)
+            last = block_starts[block_number]
+            if first >= last:
+                continue
 
-        for block in blocks[:2] if testing else blocks:
-            # Create temporary variable for saving block performance
-            block_performance = []
+            # Keep the block's average performance up to date
+            block_performance = RunningStats()
+            if feed:
+                feed.start_block()
 
-            # Run trials per pseudo-randomly created info
-            for trial_colour in block[1]:
-                current_trial += 1
+            # Run the planned trials of this block
+            for i in range(first, last):
+                trial_colour, block_type, offset = trials[i]
+                current_trial = i + 1
                 start_time = time()
 
-                # Generate trial
-                report: dict = single_trial(trial_colour, block[0], settings)
+                # Run trial, and prepare the next one during its feedback
+                next_trial = trials[i + 1] if i + 1 < last else None
+                report: dict = single_trial(
+                    trial_colour, block_type, offset, settings, next_trial
+                )
                 end_time = time()
 
                 # Save trial data
-                data.append(
-                    {
-                        "trial_number": current_trial,
-                        "block": blocks.index(block) + 1,
-                        "block_type": block[0],
-                        "start_time": str(
-                            dt.timedelta(seconds=(start_time - start_of_experiment))
-                        ),
-                        "end_time": str(
-                            dt.timedelta(seconds=(end_time - start_of_experiment))
-                        ),
-                        "target_colour": trial_colour,
-                        **report,
-                    }
-                )
+                with settings["profiler"].phase("saving"):
+                    writer.write(
+                        {
+                            "trial_number": current_trial,
+                            "block": block_number,
+                            "block_type": block_type,
+                            "start_time": str(
+                                dt.timedelta(seconds=(start_time - start_of_experiment))
+                            ),
+                            "end_time": str(
+                                dt.timedelta(seconds=(end_time - start_of_experiment))
+                            ),
+                            "target_colour": trial_colour,
+                            **report,
+                        }
+                    )
 
-                block_performance.append(report["performance"])
+                block_performance.update(report["performance"])
+                if feed:
+                    feed.trial_done(current_trial, block_number, block_type, report)
+
+            # Make sure this block's data is safely on disk
+            with settings["profiler"].phase("saving"):
+                writer.flush()
+                update_trials_completed(registry, session, writer.n_trials)
+
+            # Keep this block's timings apart, before the break
+            settings["profiler"].end_block(block_number)
 
             # Calculate average performance score for most recent block
-            avg_score = round(mean(block_performance))
+            avg_score = round(block_performance.mean)
+
+            # The next block's first trial is prepared during the break
+            next_trial = trials[last] if last < len(trials) else None
 
             # Break after end of block, unless it's the last block.
-            if blocks.index(block) + 1 == N_BLOCKS // 2:
-                long_break(
-                    N_BLOCKS,
-                    avg_score,
-                    settings,
-                )
-            elif blocks.index(block) + 1 < N_BLOCKS:
+            # Show the break again after calibrating the eyetracker
+            calibrated = True
+            if block_number == N_BLOCKS // 2:
+                while calibrated:
+                    calibrated = long_break(
+                        N_BLOCKS,
+                        avg_score,
+                        settings,
+                        eyetracker,
+                        next_trial,
+                    )
+            elif block_number < N_BLOCKS:
                 while calibrated:
                     calibrated = block_break(
-                        block + 1,
+                        block_number,
                         N_BLOCKS,
                         avg_score,
                         settings,
+                        eyetracker,
+                        next_trial,
                     )
 
         finished_early = False
@@ -134,21 +308,39 @@ def main():
         traceback.print_exc()
 
     finally:
-        # Save all collected trial data to a new .csv
-        pd.DataFrame(data).to_csv(
-            rf"{settings['directory']}\data_session_{new_participants.session_number.iloc[-1]}{'_test' if testing else ''}.csv",
-            index=False,
-        )
+        gc.enable()
 
-        # Register how many trials this participant has completed
-        new_participants.loc[new_participants.index[-1], "trials_completed"] = str(
-            len(data)
-        )
+        # Write any remaining trial data and stop the writer
+        with settings["profiler"].phase("saving"):
+            writer.close()
+            if settings["sampler"]:
+                settings["sampler"].close()
+            if settings["eyetracker"]:
+                settings["eyetracker"].close()
+            if feed:
+                feed.close()
 
-        # Save participant data to existing .csv file
-        new_participants.to_csv(
-            rf"{settings['directory']}\participantinfo.csv", index=False
-        )
+            # Also keep the data in typed columns, listed in the session index.
+            # If that fails, the .csv is still the complete record
+            if writer.n_trials:
+                try:
+                    # Imported here, because loading pandas slows down the start-up
+                    from store import write_session
+
+                    write_session(
+                        writer.path,
+                        settings["directory"],
+                        participant,
+                        session,
+                        testing,
+                    )
+                except Exception as e:
+                    print(f"Could not convert {writer.path} to Parquet:")
+                    print(e.__class__.__name__ + ": " + str(e))
+
+        # Register how many trials this participant has completed
+        update_trials_completed(registry, session, writer.n_trials)
+        registry.close()
 
         # Done!
         if finished_early:
@@ -157,7 +349,13 @@ def main():
             # Thanks for meedoen
             finish(N_BLOCKS, settings)
 
-        core.quit()
+        if profile:
+            print(settings["profiler"].report())
+            settings["profiler"].save(
+                os.path.join(directory, f"profile_session_{session_name}")
+            )
+
+        settings["core"].quit()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,250 @@
+"""
+This file contains the functions necessary for
+timing the functions that run on every trial or every frame,
+and checking that a change hasn't made them slower.
+To run the 'colour categorisation' experiment, see main.py.
+
+Every function is run headless, for each number of colours, and its median
+time per call and the memory it allocates per call are compared to the
+baseline in benchmark_baseline.json. A function fails the run when it got
+slower than the threshold (1.5 = 50% slower) and also by more than the
+timings of both runs vary by themselves. The first run, or a run with
+--save-baseline, stores the times as the new baseline. Times depend on the
+computer, so only compare to a baseline made on the same one.
+
+Usage: python micro_benchmark.py [--colours N [N ...]] [--threshold T]
+                                 [--save-baseline] [--baseline PATH]
+
+made by Anna van Harmelen, 2025
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import timeit
+import tracemalloc
+import numpy as np
+from block import create_block_list
+from main import N_BLOCKS, TRIALS_PER_BLOCK
+from response import (
+    INNER_RADIUS_COLOUR_WHEEL,
+    RADIUS_COLOUR_WHEEL,
+    create_colours,
+    create_wedges,
+    evaluate_response,
+    get_colour,
+    get_colour_table,
+    make_marker,
+    move_marker,
+)
+from set_up import get_monitor_and_dir, get_settings
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "benchmark_baseline.json")
+N_COLOURS = [360, 3600]
+THRESHOLD = 1.5
+
+# Session number the block schedules are seeded with, so every run is the same
+SEED = 1
+
+# Each time is the median of this many rounds, of at least 0.2 s each
+REPEATS = 9
+
+# A slowdown only counts when it's this many times larger than the noise, the
+# spread between the rounds of the run and of the baseline
+NOISE_FACTOR = 3
+
+# Mouse positions that are cycled through, so every call gets another one
+N_POSITIONS = 1000
+
+
+def bench_create_block_list(n_colours, settings, rng):
+    # A block can't have more trials than there are colours
+    n_trials = min(TRIALS_PER_BLOCK, n_colours)
+    return lambda: create_block_list(N_BLOCKS, n_trials, n_colours, session=SEED)
+
+
+def bench_create_colours(n_colours, settings, rng):
+    return lambda: create_colours(n_colours, "medium")
+
+
+def bench_create_wedges(n_colours, settings, rng):
+    # Load the colour table first, only the vertices and stimuli are timed
+    get_colour_table("medium", settings)
+    return lambda: create_wedges("medium", settings)
+
+
+def bench_get_colour(n_colours, settings, rng):
+    colours = create_colours(n_colours, "medium")
+    positions = iter_positions(rng)
+    return lambda: get_colour(next(positions), 30, colours)
+
+
+def bench_move_marker(n_colours, settings, rng):
+    colours = create_colours(n_colours, "medium")
+    colour_table = get_colour_table("medium", settings)
+    marker = make_marker(RADIUS_COLOUR_WHEEL, INNER_RADIUS_COLOUR_WHEEL, settings)
+    positions = iter_positions(rng)
+    return lambda: move_marker(
+        marker,
+        next(positions),
+        30,
+        colours,
+        RADIUS_COLOUR_WHEEL,
+        INNER_RADIUS_COLOUR_WHEEL,
+        settings,
+        colour_table,
+    )
+
+
+def bench_evaluate_response(n_colours, settings, rng):
+    colours = create_colours(n_colours, "medium")
+    pairs = [
+        (colours[int(selected)], colours[int(target)])
+        for selected, target in rng.integers(n_colours, size=(N_POSITIONS, 2))
+    ]
+    pairs = cycle(pairs)
+    return lambda: evaluate_response(*next(pairs), colours)
+
+
+BENCHMARKS = {
+    "create_block_list": bench_create_block_list,
+    "create_colours": bench_create_colours,
+    "create_wedges": bench_create_wedges,
+    "get_colour": bench_get_colour,
+    "move_marker": bench_move_marker,
+    "evaluate_response": bench_evaluate_response,
+}
+
+
+def cycle(items):
+    while True:
+        yield from items
+
+
+def iter_positions(rng):
+    # Positions all around the colour wheel, in pixels
+    angles = rng.uniform(0, 2 * np.pi, N_POSITIONS)
+    return cycle(list(zip(100 * np.cos(angles), 100 * np.sin(angles))))
+
+
+def measure(function):
+    """
+    Returns the median time per call in seconds, how much the rounds vary
+    (the interquartile range as a fraction of the median), and the peak memory
+    in bytes allocated during one call.
+    """
+    # Call it once first, so nothing that's made once is counted
+    function()
+
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    times = np.array(timer.repeat(REPEATS, number)) / number
+    seconds = float(np.median(times))
+    low, high = np.percentile(times, [25, 75])
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return seconds, float(high - low) / seconds, peak
+
+
+def run_benchmarks(n_colours_list, directory):
+    monitor, _ = get_monitor_and_dir(testing=True)
+    results = {}
+    for n_colours in n_colours_list:
+        # Settings of the headless backend, so there's no window or GPU
+        settings = get_settings(monitor, directory, backend="headless")
+        settings["n_colours"] = n_colours
+        rng = np.random.default_rng(n_colours)
+
+        for name, benchmark in BENCHMARKS.items():
+            seconds, noise, peak = measure(benchmark(n_colours, settings, rng))
+            results[f"{name}[{n_colours}]"] = {
+                "seconds": seconds,
+                "noise": noise,
+                "bytes": peak,
+            }
+
+    return results
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_baseline(results, path):
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+
+
+def compare(results, baseline, threshold):
+    """Prints every result next to its baseline, returns the ones that got slower."""
+    print(
+        f"{'function':<28} {'time':>11} {'noise':>6} {'baseline':>11} {'ratio':>6} "
+        f"{'memory':>10}"
+    )
+    slower = []
+    for key, result in results.items():
+        time = f"{result['seconds'] * 1e6:.2f} us"
+        noise = f"{result['noise']:.0%}"
+        memory = f"{result['bytes'] / 1024:.1f} KiB"
+        if baseline is None or key not in baseline:
+            print(f"{key:<28} {time:>11} {noise:>6} {'-':>11} {'-':>6} {memory:>10}")
+            continue
+
+        # Baselines from before the noise was measured count as noiseless
+        ratio = result["seconds"] / baseline[key]["seconds"]
+        both_noise = result["noise"] + baseline[key].get("noise", 0)
+        is_slower = ratio > max(threshold, 1 + NOISE_FACTOR * both_noise)
+        flag = "  SLOWER" if is_slower else ""
+        print(
+            f"{key:<28} {time:>11} {noise:>6} "
+            f"{baseline[key]['seconds'] * 1e6:>8.2f} us {ratio:>6.2f} "
+            f"{memory:>10}{flag}"
+        )
+        if is_slower:
+            slower.append(key)
+
+    return slower
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--colours", type=int, nargs="+", default=N_COLOURS)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=THRESHOLD,
+        help="fail when a function takes this many times its baseline time",
+    )
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="store these times as baseline"
+    )
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    arguments = parser.parse_args()
+
+    # Colour tables are cached on disk, keep them out of the repository
+    with tempfile.TemporaryDirectory() as directory:
+        results = run_benchmarks(arguments.colours, directory)
+
+    baseline = load_baseline(arguments.baseline)
+    slower = compare(results, baseline, arguments.threshold)
+
+    if baseline is None or arguments.save_baseline:
+        # Keep earlier results for numbers of colours that weren't run now
+        save_baseline({**(baseline or {}), **results}, arguments.baseline)
+        print(f"\nSaved baseline: {arguments.baseline}")
+    elif slower:
+        print(
+            f"\n{len(slower)} function(s) more than {arguments.threshold:.2f}x "
+            f"slower than the baseline: {', '.join(slower)}"
+        )
+        sys.exit(1)
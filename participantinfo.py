@@ -3,18 +3,159 @@ This file contains the functions necessary for
 collecting participant data.
 To run the 'colour categorisation' experiment, see main.py.
 
+Participants and sessions are registered in participantinfo.db (SQLite),
+which hands out participant and session numbers atomically, so several
+computers can share it. An existing participantinfo.csv is imported once.
+
 made by Anna van Harmelen, 2025
 """
 
+import os
 import random
-import pandas as pd
+import sqlite3
+
+PARTICIPANT_NUMBERS = range(10, 100)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_number INTEGER PRIMARY KEY AUTOINCREMENT,
+    participant_number INTEGER NOT NULL,
+    age INTEGER NOT NULL,
+    trials_completed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS sessions_by_participant ON sessions (participant_number);
+
+-- Participant numbers that haven't been used yet, in slots 0 to n - 1
+CREATE TABLE IF NOT EXISTS free_numbers (
+    slot INTEGER PRIMARY KEY,
+    participant_number INTEGER NOT NULL UNIQUE
+);
+"""
+
+
+def open_registry(directory):
+    connection = sqlite3.connect(
+        os.path.join(directory, "participantinfo.db"), timeout=30, isolation_level=None
+    )
+    connection.executescript(SCHEMA)
+
+    # Set up a new registry only once, even if two computers start at once
+    connection.execute("BEGIN IMMEDIATE")
+    if connection.execute("PRAGMA user_version").fetchone()[0] == 0:
+        connection.executemany(
+            "INSERT INTO free_numbers VALUES (?, ?)", enumerate(PARTICIPANT_NUMBERS)
+        )
+
+        csv_path = os.path.join(directory, "participantinfo.csv")
+        if os.path.exists(csv_path):
+            import_csv(connection, csv_path)
+
+        connection.execute("PRAGMA user_version = 1")
+    connection.execute("COMMIT")
+
+    return connection
+
+
+def import_csv(connection, csv_path):
+    # Only needed once, and loading pandas is slow
+    import pandas as pd
+
+    old_participants = pd.read_csv(csv_path)
+    trials_completed = pd.to_numeric(old_participants.trials_completed, errors="coerce")
+
+    connection.executemany(
+        "INSERT OR IGNORE INTO sessions VALUES (?, ?, ?, ?)",
+        zip(
+            old_participants.session_number.astype(int).tolist(),
+            old_participants.participant_number.astype(int).tolist(),
+            old_participants.age.astype(int).tolist(),
+            trials_completed.fillna(0).astype(int).tolist(),
+        ),
+    )
+
+    # Take the participant numbers that were used out of the pool, keeping the
+    # free numbers in consecutive slots
+    used = set(old_participants.participant_number.astype(int))
+    free = [number for number in PARTICIPANT_NUMBERS if number not in used]
+    connection.execute("DELETE FROM free_numbers")
+    connection.executemany("INSERT INTO free_numbers VALUES (?, ?)", enumerate(free))
+
+
+def allocate_participant_number(connection):
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        (last_slot,) = connection.execute(
+            "SELECT MAX(slot) FROM free_numbers"
+        ).fetchone()
+        if last_slot is None:
+            raise Exception(
+                f"All participant numbers from {PARTICIPANT_NUMBERS.start} to "
+                f"{PARTICIPANT_NUMBERS.stop - 1} have been used."
+            )
 
+        # Draw a random free number and fill its slot with the last free number
+        slot = random.randint(0, last_slot)
+        (participant,) = connection.execute(
+            "SELECT participant_number FROM free_numbers WHERE slot = ?", (slot,)
+        ).fetchone()
+        (last_number,) = connection.execute(
+            "SELECT participant_number FROM free_numbers WHERE slot = ?", (last_slot,)
+        ).fetchone()
+        connection.execute("DELETE FROM free_numbers WHERE slot = ?", (last_slot,))
+        if slot != last_slot:
+            connection.execute(
+                "UPDATE free_numbers SET participant_number = ? WHERE slot = ?",
+                (last_number, slot),
+            )
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
 
-def get_participant_details(existing_participants: pd.DataFrame, testing):
+    return participant
+
+
+def register_session(connection, participant, age):
+    # Session numbers are handed out by the database, so they're never reused
+    cursor = connection.execute(
+        "INSERT INTO sessions (participant_number, age) VALUES (?, ?)",
+        (participant, age),
+    )
+
+    return cursor.lastrowid
+
+
+def update_trials_completed(connection, session, trials_completed):
+    connection.execute(
+        "UPDATE sessions SET trials_completed = ? WHERE session_number = ?",
+        (trials_completed, session),
+    )
+
+
+def get_session_participant(connection, session):
+    row = connection.execute(
+        "SELECT participant_number FROM sessions WHERE session_number = ?", (session,)
+    ).fetchone()
+    if row is None:
+        raise Exception(f"Session {session} is not in the participant registry.")
+
+    return row[0]
+
+
+def get_session_owners(directory):
+    # Which participant did each session
+    connection = open_registry(directory)
+    owners = dict(
+        connection.execute("SELECT session_number, participant_number FROM sessions")
+    )
+    connection.close()
+
+    return owners
+
+
+def get_participant_details(registry, testing):
     # Generate random & unique participant number
-    participant = random.randint(10, 99)
-    while participant in existing_participants.participant_number.tolist():
-        participant = random.randint(10, 99)
+    participant = allocate_participant_number(registry)
 
     print(f"Participant number: {participant}")
 
@@ -25,13 +166,6 @@ def get_participant_details(existing_participants: pd.DataFrame, testing):
         age = 00
 
     # Insert session number
-    session = max(existing_participants.session_number) + 1
-
-    new_participant = pd.DataFrame(
-        {"age": [age], "participant_number": [participant], "session_number": [session]}
-    )
-    all_participants = pd.concat(
-        [existing_participants, new_participant], ignore_index=True
-    )
+    session = register_session(registry, participant, age)
 
-    return all_participants
+    return participant, session
@@ -0,0 +1,106 @@
+"""
+This file contains the functions necessary for
+planning every trial of a session before it starts.
+To run the 'colour categorisation' experiment, see main.py.
+
+The plan holds one PLAN_DTYPE record per trial, practice trials first, and
+is saved as plan_session_<n>.npy. Everything random about a trial (its
+target, saturation level and colour wheel offset) is drawn here, seeded by
+the session number, so the experiment itself draws no random numbers and
+a session can always be run or resumed again exactly the same way.
+
+made by Anna van Harmelen, 2025
+"""
+
+import os
+import numpy as np
+from schedule import BLOCK_TYPES
+
+PLAN_DTYPE = np.dtype(
+    [
+        ("block", "i2"),  # 0 for practice trials
+        ("block_type", "u1"),  # index into BLOCK_TYPES
+        ("target_colour", "i4"),
+        ("colour_wheel_offset", "i2"),
+    ]
+)
+
+# Practice trials per round, and rounds planned (more rounds start over)
+PRACTICE_TRIALS = 5
+PRACTICE_ROUNDS = 10
+
+
+def compile_plan(blocks, n_colours, seed=None):
+    rng = np.random.default_rng(seed)
+    n_practice = PRACTICE_TRIALS * PRACTICE_ROUNDS
+    n_trials = sum(len(colours) for _, colours in blocks)
+    plan = np.zeros(n_practice + n_trials, dtype=PLAN_DTYPE)
+
+    # Practice trials have random targets and saturation levels
+    plan["block_type"][:n_practice] = rng.integers(0, len(BLOCK_TYPES), n_practice)
+    plan["target_colour"][:n_practice] = rng.integers(1, n_colours + 1, n_practice)
+
+    # The blocks follow their schedule
+    plan["block"][n_practice:] = np.repeat(
+        np.arange(1, len(blocks) + 1), [len(colours) for _, colours in blocks]
+    )
+    plan["block_type"][n_practice:] = np.repeat(
+        [BLOCK_TYPES.index(block_type) for block_type, _ in blocks],
+        [len(colours) for _, colours in blocks],
+    )
+    plan["target_colour"][n_practice:] = [
+        colour for _, colours in blocks for colour in colours
+    ]
+
+    # The colour wheel is rotated by 0 to 360 degrees on every trial
+    plan["colour_wheel_offset"] = rng.integers(0, 361, len(plan))
+
+    return plan
+
+
+def load_plan(directory, session_name, blocks, n_colours, seed=None):
+    # Use the plan made when the session first started, if there is one, but
+    # only if it still follows the session's schedule
+    path = os.path.join(directory, f"plan_session_{session_name}.npy")
+    if os.path.exists(path):
+        plan = np.load(path)
+        planned = get_trials(plan)[1]
+        scheduled = [
+            (colour, block_type)
+            for block_type, colours in blocks
+            for colour in colours
+        ]
+        if [(colour, block_type) for colour, block_type, _ in planned] != scheduled:
+            raise ValueError(
+                f"{path} doesn't match the schedule of this session, "
+                "remove it or use another session number."
+            )
+        return plan
+
+    plan = compile_plan(blocks, n_colours, seed)
+    np.save(path, plan)
+
+    return plan
+
+
+def get_trials(plan):
+    """
+    Returns the practice and experiment trials of the plan as lists of
+    (target colour, block type, colour wheel offset), ready for single_trial.
+    """
+    trials = list(
+        zip(
+            plan["target_colour"].tolist(),
+            [BLOCK_TYPES[kind] for kind in plan["block_type"].tolist()],
+            plan["colour_wheel_offset"].tolist(),
+        )
+    )
+    n_practice = int((plan["block"] == 0).sum())
+
+    return trials[:n_practice], trials[n_practice:]
+
+
+def get_block_starts(plan):
+    # Index of each block's first trial in the experiment trials, plus the end
+    blocks = plan["block"][plan["block"] > 0]
+    return np.searchsorted(blocks, np.arange(1, blocks.max() + 2)).tolist()
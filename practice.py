@@ -5,48 +5,52 @@ To run the 'colour categorisation' experiment, see main.py.
 made by Anna van Harmelen, 2025
 """
 
-from trial import single_trial, show_text
-import random
+from trial import single_trial, show_text, prefetch_trial
+from plan import PRACTICE_TRIALS
 from response import wait_for_key
-from numpy import mean
-from time import sleep
+from feed import RunningStats
 
 
-def practice(settings):
+def practice(settings, trials, first_trial=None):
     # Show welcome
     show_text(
         "Welcome to the experiment! You'll start by practising the task."
         "\n\nPress SPACE to start the practice.",
-        settings["window"],
+        settings,
     )
     settings["window"].flip()
-    wait_for_key(["space"], settings["keyboard"])
+    wait_for_key(["space"], settings)
 
-    practice_performance = []
+    practice_performance = RunningStats()
     practice = True
+    practice_round = 0
 
     # Practice until done
     while practice:
-        for i in range(5):
-            # Generate random conditions
-            trial_colour = random.randint(1, 360)
-            saturation = random.choice(["low", "medium", "high"])
+        # Take the next planned round, starting over after the last one
+        start = practice_round * PRACTICE_TRIALS % len(trials)
+        round_trials = trials[start : start + PRACTICE_TRIALS]
+        practice_round += 1
 
-            # Generate trial
-            report: dict = single_trial(trial_colour, saturation, settings)
+        for i, (trial_colour, saturation, offset) in enumerate(round_trials):
+            # Run trial, and prepare the next one during its feedback
+            next_trial = round_trials[i + 1] if i + 1 < len(round_trials) else None
+            report: dict = single_trial(
+                trial_colour, saturation, offset, settings, next_trial
+            )
 
             # Save score
-            practice_performance.append(report["performance"])
+            practice_performance.update(report["performance"])
 
         # Check if the participant wants to continue
-        avg_score = mean(practice_performance)
+        avg_score = practice_performance.mean
         show_text(
             f"Your average score on these 5 practice trials was {avg_score}."
             "\n\nPress SPACE to practice 5 more trials, or G to continue to the experiment.",
-            settings["window"],
+            settings,
         )
         settings["window"].flip()
-        keys = wait_for_key(["space", "g"], settings["keyboard"])
+        keys = wait_for_key(["space", "g"], settings)
 
         if "g" in keys:
             practice = False
@@ -55,9 +59,13 @@ def practice(settings):
     for i in range(4):
         show_text(
             f"The experiment will start in {3-i}",
-            settings["window"],
+            settings,
         )
         settings["window"].flip()
 
+        # Prepare the first trial of the experiment during the countdown
+        if i == 0:
+            prefetch_trial(first_trial, settings)
+
         if i != 3:
-            sleep(1)
+            settings["core"].wait(1)
@@ -0,0 +1,181 @@
+"""
+This file contains the functions necessary for
+measuring how much time each phase of the experiment takes.
+To run the 'colour categorisation' experiment, see main.py.
+
+Phases can be nested, so besides a report per phase and per block, the
+profiler can write folded stacks ("trial;response_loop;drawing 1234", in
+microseconds of self time) that flame graph tools read directly.
+
+made by Anna van Harmelen, 2025
+"""
+
+from contextlib import nullcontext
+from time import perf_counter
+
+
+class _Phase:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._stack.append(self.name)
+        self.start = perf_counter()
+
+    def __exit__(self, *exception):
+        elapsed = perf_counter() - self.start
+        stack = self.profiler._stack
+        key = tuple(stack)
+        stack.pop()
+
+        self.profiler.totals[key] = self.profiler.totals.get(key, 0) + elapsed
+        self.profiler.calls[key] = self.profiler.calls.get(key, 0) + 1
+
+
+class Profiler:
+    """Adds up the wall time spent in each named phase, and counts events."""
+
+    def __init__(self):
+        self.totals = {}
+        self.calls = {}
+        self.counters = {}
+        self.blocks = []
+        self._stack = []
+        self._previous_block = ({}, {})
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def record(self, stack, seconds):
+        # Add a time that was measured before the profiler existed
+        self.totals[stack] = self.totals.get(stack, 0) + seconds
+        self.calls[stack] = self.calls.get(stack, 0) + 1
+
+    def phase_totals(self):
+        # Total time and number of calls per phase name, wherever it was nested
+        phases = {}
+        for stack, total in self.totals.items():
+            time, calls = phases.get(stack[-1], (0, 0))
+            phases[stack[-1]] = (time + total, calls + self.calls[stack])
+
+        return phases
+
+    def start_blocks(self):
+        # Leave what happened before the first block out of the block timings
+        self._previous_block = self.phase_totals(), dict(self.counters)
+
+    def end_block(self, label):
+        # Keep what happened since the previous block
+        phases, counters = self.phase_totals(), dict(self.counters)
+        previous_phases, previous_counters = self._previous_block
+        self.blocks.append(
+            (
+                label,
+                {
+                    name: (
+                        time - previous_phases.get(name, (0, 0))[0],
+                        calls - previous_phases.get(name, (0, 0))[1],
+                    )
+                    for name, (time, calls) in phases.items()
+                    if calls != previous_phases.get(name, (0, 0))[1]
+                },
+                {
+                    name: n - previous_counters.get(name, 0)
+                    for name, n in counters.items()
+                },
+            )
+        )
+        self._previous_block = phases, counters
+
+    def report(self):
+        phases = self.phase_totals()
+        lines = [f"{'phase':<20}{'calls':>10}{'total (s)':>12}{'mean (ms)':>12}"]
+        for name, (total, calls) in sorted(
+            phases.items(), key=lambda item: -item[1][0]
+        ):
+            lines.append(
+                f"{name:<20}{calls:>10}{total:>12.3f}{total / calls * 1000:>12.3f}"
+            )
+
+        lines.append("")
+        lines.append(f"{'counter':<30}{'count':>12}")
+        for name, n in sorted(self.counters.items()):
+            lines.append(f"{name:<30}{n:>12}")
+        if self.counters.get("frames"):
+            draws_per_frame = self.counters.get("draws", 0) / self.counters["frames"]
+            lines.append(f"{'draws per frame':<30}{draws_per_frame:>12.2f}")
+
+        # Mean time per call of each phase, per block
+        if self.blocks:
+            names = sorted(
+                {name for _, block_phases, _ in self.blocks for name in block_phases}
+            )
+            lines.append("")
+            lines.append("mean time per call (ms), per block")
+            lines.append(f"{'block':<10}" + "".join(f"{name:>20}" for name in names))
+            for label, block_phases, _ in self.blocks:
+                means = {
+                    name: time / calls * 1000
+                    for name, (time, calls) in block_phases.items()
+                }
+                lines.append(
+                    f"{label:<10}"
+                    + "".join(
+                        f"{means[name]:>20.3f}" if name in means else f"{'-':>20}"
+                        for name in names
+                    )
+                )
+
+        return "\n".join(lines)
+
+    def folded_stacks(self):
+        # Self time of each stack: its total minus the time spent in nested phases
+        self_times = dict(self.totals)
+        for stack, total in self.totals.items():
+            if len(stack) > 1:
+                self_times[stack[:-1]] = self_times.get(stack[:-1], 0) - total
+
+        return "\n".join(
+            f"{';'.join(stack)} {max(round(time * 1e6), 0)}"
+            for stack, time in sorted(self_times.items())
+        )
+
+    def save(self, path):
+        # Write the report and the folded stacks next to each other
+        with open(f"{path}.txt", "w") as file:
+            file.write(self.report() + "\n")
+        with open(f"{path}.folded", "w") as file:
+            file.write(self.folded_stacks() + "\n")
+
+
+class NullProfiler:
+    """Stand-in for Profiler when profiling is switched off."""
+
+    _nothing = nullcontext()
+
+    def phase(self, name):
+        return self._nothing
+
+    def count(self, name, n=1):
+        pass
+
+    def record(self, stack, seconds):
+        pass
+
+    def start_blocks(self):
+        pass
+
+    def end_block(self, label):
+        pass
+
+    def report(self):
+        return ""
+
+    def save(self, path):
+        pass
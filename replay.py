@@ -0,0 +1,425 @@
+"""
+This file contains the functions necessary for
+replaying the trials of a session from its saved data.
+To run the 'colour categorisation' experiment, see main.py.
+
+Each trial is rebuilt from the session's data file, its plan and, when they
+were recorded, its mouse trajectories: the rotated wheel, the target and the
+path of the marker during the response. All responses are scored again at
+once to check the saved scores, and with --render every trial is drawn
+off-screen by parallel workers and saved as replay_session_<n>.mp4 (or as
+raw RGB frames in replay_session_<n>.rgb when ffmpeg isn't installed).
+
+Usage: python replay.py <data directory> <session> [--test] [--render]
+       [--fps N] [--workers N]
+
+made by Anna van Harmelen, 2025
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+import numpy as np
+import pandas as pd
+from checkpoint import get_journal_path, load_journal
+from colourspace import calibration_hash, get_calibration, load_colour_table
+from plan import get_trials
+from response import (
+    INNER_RADIUS_COLOUR_WHEEL,
+    RADIUS_COLOUR_WHEEL,
+    SATURATIONS,
+    angles_to_hues,
+    score_responses,
+)
+from set_up import get_deg2pix, get_monitor_and_dir
+from store import parse_trials
+from trajectory import get_trajectory, load_trajectories
+from trial import FEEDBACK_DURATION
+
+SCORE_COLUMNS = [
+    "abs_rgb_distance",
+    "rgb_distance",
+    "rgb_distance_signed",
+    "performance",
+]
+
+# Hue steps a trajectory may be off from the saved response, because the
+# mouse is sampled independently of the frame that was clicked on
+TRAJECTORY_TOLERANCE = 1
+
+# Grey of the experiment's window, and the marker's size in pixels
+BACKGROUND = 64
+MARKER_WIDTH = 15
+
+# Trials per worker that are rendered or waiting to be written at once
+TRIALS_IN_FLIGHT = 2
+
+# Geometry of the frames, set once in each worker process by set_geometry
+_geometry = None
+
+
+def load_session(directory, session, testing=False):
+    """
+    Returns the trials of a session as a DataFrame, with the selected hue in
+    its own column, and its mouse samples and their index (None if the
+    session's trajectories weren't recorded).
+    """
+    session_name = f"{session}{'_test' if testing else ''}"
+    trials = parse_trials(
+        pd.read_csv(os.path.join(directory, f"data_session_{session_name}.csv"))
+    )
+
+    # Compare every trial to the plan it was run from, when there is one
+    plan_path = os.path.join(directory, f"plan_session_{session_name}.npy")
+    if os.path.exists(plan_path):
+        _, planned = get_trials(np.load(plan_path))
+        planned = [planned[number - 1] for number in trials.trial_number]
+        trials["matches_plan"] = [
+            (target, block_type, offset) == trial
+            for target, block_type, offset, trial in zip(
+                trials.target_colour,
+                trials.block_type,
+                trials.colour_wheel_offset,
+                planned,
+            )
+        ]
+
+    samples, index = None, None
+    if os.path.exists(
+        os.path.join(directory, f"trajectories_session_{session_name}_index.npy")
+    ):
+        samples, index = load_trajectories(directory, session_name)
+
+    return trials, samples, index
+
+
+def get_click_positions(trials, samples, index):
+    # Mouse position when the response was given: the first sample with the
+    # left button down, or the last one if the click fell between samples
+    positions = np.full((len(trials), 2), np.nan)
+    for i, trial_number in enumerate(trials.trial_number):
+        if index is None or trial_number not in index["trial_number"]:
+            continue
+        trajectory = get_trajectory(samples, index, trial_number)
+        if len(trajectory) == 0:
+            continue
+        clicked = np.flatnonzero(trajectory["buttons"] & 1)
+        sample = trajectory[clicked[0] if len(clicked) else -1]
+        positions[i] = sample["x"], sample["y"]
+
+    return positions
+
+
+def validate_session(trials, samples=None, index=None):
+    """
+    Scores all responses again at once and compares them to the saved
+    scores and, where there is a trajectory, to the hue under the mouse.
+    """
+    n_colours = trials.n_colours.to_numpy()
+    scores = score_responses(
+        trials.target_colour.to_numpy(), trials.selected_hue.to_numpy(), n_colours
+    )
+    validation = pd.DataFrame({"trial_number": trials.trial_number})
+    validation["scores_match"] = np.logical_and.reduce(
+        [scores[column] == trials[column].to_numpy() for column in SCORE_COLUMNS]
+    )
+
+    # Same angle -> colour rule as get_colour, for every click at once
+    positions = get_click_positions(trials, samples, index)
+    has_trajectory = ~np.isnan(positions[:, 0])
+    angles = np.degrees(np.arctan2(positions[:, 1], positions[:, 0])) % 360
+    trajectory_hues = angles_to_hues(
+        np.nan_to_num(angles), trials.colour_wheel_offset.to_numpy(), n_colours
+    )
+    difference = np.abs(trajectory_hues - trials.selected_hue.to_numpy())
+    difference = np.minimum(difference, n_colours - difference)
+
+    validation["trajectory_hue"] = pd.Series(trajectory_hues, dtype="Int32").where(
+        has_trajectory
+    )
+    validation["trajectory_matches"] = pd.Series(
+        difference <= TRAJECTORY_TOLERANCE, dtype="boolean"
+    ).where(has_trajectory)
+
+    if "matches_plan" in trials:
+        validation["matches_plan"] = trials.matches_plan.to_numpy()
+
+    return validation
+
+
+def get_geometry(monitor):
+    # Sizes of everything on screen in pixels, and the pixel grid of a frame
+    deg2pix = get_deg2pix(monitor)
+    radius = deg2pix(RADIUS_COLOUR_WHEEL)
+    geometry = {
+        "radius": radius,
+        "inner_radius": deg2pix(INNER_RADIUS_COLOUR_WHEEL),
+        "target_size": deg2pix(2),
+        "size": 2 * radius + 2 * MARKER_WIDTH,
+    }
+
+    # Position of each pixel centre, row 0 is the top row of the frame
+    coordinates = np.arange(geometry["size"]) - geometry["size"] / 2 + 0.5
+    x, y = np.meshgrid(coordinates, -coordinates)
+    geometry["x"], geometry["y"] = x, y
+
+    # Which pixels the wheel and target cover, and the angle of each wheel
+    # pixel, are the same on every frame of every trial
+    distance = np.hypot(x, y)
+    geometry["donut"] = (distance >= geometry["inner_radius"]) & (
+        distance <= geometry["radius"]
+    )
+    geometry["donut_angles"] = (
+        np.degrees(np.arctan2(y[geometry["donut"]], x[geometry["donut"]])) % 360
+    )
+    half = geometry["target_size"] / 2
+    geometry["target"] = (np.abs(x) <= half) & (np.abs(y) <= half)
+
+    return geometry
+
+
+def to_rgb(colours):
+    # PsychoPy colours go from -1 to 1
+    return np.round((np.asarray(colours) + 1) * 127.5).astype(np.uint8)
+
+
+def get_frame_positions(trial, samples, index, fps):
+    """
+    Mouse position on every frame of the replay, NaN while the marker wasn't
+    shown. Without a trajectory, the marker is shown at the selected hue.
+    """
+    trajectory = []
+    if index is not None and trial.trial_number in index["trial_number"]:
+        trajectory = get_trajectory(samples, index, trial.trial_number)
+
+    if len(trajectory) == 0:
+        hue_angle = (trial.selected_hue + 0.5) * 360 / trial.n_colours
+        angle = np.radians(hue_angle + trial.colour_wheel_offset)
+        n_frames = max(1, round(fps * FEEDBACK_DURATION))
+        return np.tile([np.cos(angle), np.sin(angle)], (n_frames, 1))
+
+    # Take the latest sample at every frame, the marker appears once the
+    # participant starts moving
+    times = trajectory["time"]
+    frame_times = np.arange(times[0], times[-1] + 1 / fps, 1 / fps)
+    sample = np.searchsorted(times, frame_times, side="right") - 1
+    positions = np.stack(
+        [trajectory["x"][sample], trajectory["y"][sample]], axis=1
+    ).astype(float)
+    positions[frame_times < times[0] + trial.idle_reaction_time_in_ms / 1000] = np.nan
+
+    return positions
+
+
+def set_geometry(geometry):
+    # Each worker gets the geometry once, instead of with every trial
+    global _geometry
+    _geometry = geometry
+
+
+def render_trial(task):
+    """Draws all frames of one trial, as one (frames, height, width, 3) array."""
+    colour_table, target_hue, offset, positions = task
+    geometry = _geometry
+    x, y, size = geometry["x"], geometry["y"], geometry["size"]
+
+    # The wheel and target don't change during the trial
+    background = np.full((size, size, 3), BACKGROUND, dtype=np.uint8)
+    hues = angles_to_hues(geometry["donut_angles"], offset, len(colour_table))
+    background[geometry["donut"]] = to_rgb(colour_table[hues])
+    background[geometry["target"]] = to_rgb(
+        colour_table[target_hue % len(colour_table)]
+    )
+
+    frames = np.repeat(background[np.newaxis], len(positions), axis=0)
+    middle = (geometry["radius"] + geometry["inner_radius"]) / 2
+    height = geometry["radius"] - geometry["inner_radius"]
+
+    # Only the pixels around the marker are looked at on each frame
+    reach = int(np.ceil(np.hypot(height, MARKER_WIDTH) / 2)) + 1
+    for frame, position in zip(frames, positions):
+        if np.isnan(position[0]):
+            continue
+
+        # The marker sits across the donut at the mouse's angle, in the
+        # colour under the mouse, with a white outline
+        angle = np.arctan2(position[1], position[0])
+        column = int(round(middle * np.cos(angle) + size / 2 - 0.5))
+        row = int(round(size / 2 - 0.5 - middle * np.sin(angle)))
+        area = (
+            slice(max(row - reach, 0), row + reach + 1),
+            slice(max(column - reach, 0), column + reach + 1),
+        )
+        patch_x, patch_y, patch = x[area], y[area], frame[area]
+
+        radial = patch_x * np.cos(angle) + patch_y * np.sin(angle) - middle
+        tangential = -patch_x * np.sin(angle) + patch_y * np.cos(angle)
+        outline = (np.abs(radial) <= height / 2) & (
+            np.abs(tangential) <= MARKER_WIDTH / 2
+        )
+        inside = (np.abs(radial) <= height / 2 - 1) & (
+            np.abs(tangential) <= MARKER_WIDTH / 2 - 1
+        )
+        hue = angles_to_hues(np.degrees(angle) % 360, offset, len(colour_table))
+        patch[outline] = 255
+        patch[inside] = to_rgb(colour_table[hue])
+
+    return frames
+
+
+def get_colour_settings(directory, session_name, monitor):
+    """
+    Returns the settings load_colour_table needs to give the session's hue ids
+    the colours they had: its colour space and the monitor's calibration, as
+    saved in the session's journal.
+    """
+    journal = {}
+    if os.path.exists(get_journal_path(directory, session_name)):
+        journal = load_journal(get_journal_path(directory, session_name))
+
+    # Sessions from before these were saved used "cielab"
+    if "calibration" not in journal:
+        print(
+            "The colour space and calibration of this session weren't saved, "
+            "using cielab and the calibration of the current monitor."
+        )
+
+    return {
+        "directory": directory,
+        "monitor": {
+            **monitor,
+            "calibration": journal.get("calibration", get_calibration(monitor)),
+        },
+        "colour_space": journal.get("colour_space", "cielab"),
+    }
+
+
+def render_session(
+    directory,
+    session,
+    trials,
+    samples=None,
+    index=None,
+    testing=False,
+    fps=60,
+    workers=None,
+):
+    monitor, _ = get_monitor_and_dir(testing)
+    session_name = f"{session}{'_test' if testing else ''}"
+    settings = get_colour_settings(directory, session_name, monitor)
+    geometry = get_geometry(monitor)
+
+    # Trials run with another calibration can only be drawn approximately
+    if "calibration" in trials:
+        expected = calibration_hash(settings["monitor"]["calibration"])
+        n_different = (trials.calibration != expected).sum()
+        if n_different:
+            print(
+                f"{n_different} trials were run with another calibration than the "
+                "session started with, their colours are drawn with the first one."
+            )
+
+    # Made as they're submitted, so only the trials in flight are in memory
+    tasks = (
+        (
+            load_colour_table(trial.n_colours, SATURATIONS[trial.block_type], settings),
+            trial.target_colour,
+            trial.colour_wheel_offset,
+            get_frame_positions(trial, samples, index, fps),
+        )
+        for trial in trials.itertuples()
+    )
+
+    # Pipe the frames into ffmpeg if it's there, otherwise keep them raw
+    size = geometry["size"]
+    if shutil.which("ffmpeg"):
+        path = os.path.join(directory, f"replay_session_{session_name}.mp4")
+        encoder = subprocess.Popen(
+            ["ffmpeg", "-y", "-loglevel", "error", "-f", "rawvideo"]
+            + ["-pix_fmt", "rgb24", "-s", f"{size}x{size}", "-r", str(fps)]
+            + ["-i", "-", "-pix_fmt", "yuv420p", path],
+            stdin=subprocess.PIPE,
+        )
+        output = encoder.stdin
+    else:
+        encoder = None
+        path = os.path.join(directory, f"replay_session_{session_name}.rgb")
+        output = open(path, "wb")
+
+    # Trials are drawn in parallel, but written in order. Only a few trials
+    # per worker are submitted at once, so finished frames can't pile up
+    # when writing is slower than drawing
+    start = perf_counter()
+    n_frames = 0
+    max_in_flight = TRIALS_IN_FLIGHT * (workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=set_geometry, initargs=(geometry,)
+    ) as pool:
+        in_flight = deque()
+        for task in tasks:
+            in_flight.append(pool.submit(render_trial, task))
+            if len(in_flight) < max_in_flight:
+                continue
+            frames = in_flight.popleft().result()
+            output.write(frames.tobytes())
+            n_frames += len(frames)
+        for future in in_flight:
+            frames = future.result()
+            output.write(frames.tobytes())
+            n_frames += len(frames)
+    output.close()
+    if encoder:
+        encoder.wait()
+
+    duration = perf_counter() - start
+    print(
+        f"Rendered {n_frames} frames ({size}x{size}, {n_frames / fps:.1f} s of video) "
+        f"in {duration:.1f} s, {n_frames / fps / duration:.1f}x real time: {path}"
+    )
+
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("directory")
+    parser.add_argument("session", type=int)
+    parser.add_argument("--test", action="store_true", help="replay a test session")
+    parser.add_argument("--render", action="store_true", help="also render a video")
+    parser.add_argument("--fps", type=int, default=60)
+    parser.add_argument("--workers", type=int, default=None)
+    arguments = parser.parse_args()
+
+    trials, samples, index = load_session(
+        arguments.directory, arguments.session, arguments.test
+    )
+    validation = validate_session(trials, samples, index)
+
+    # Report every check that failed
+    checks = ["scores_match", "trajectory_matches", "matches_plan"]
+    failed = np.zeros(len(validation), dtype=bool)
+    for check in [check for check in checks if check in validation]:
+        passed = validation[check].dropna().astype(bool)
+        print(f"{check}: {passed.sum()} of {len(passed)} trials")
+        failed |= (validation[check] == False).fillna(False).to_numpy()  # noqa: E712
+    if failed.any():
+        print(validation[failed].to_string(index=False))
+
+    if arguments.render:
+        render_session(
+            arguments.directory,
+            arguments.session,
+            trials,
+            samples,
+            index,
+            arguments.test,
+            arguments.fps,
+            arguments.workers,
+        )
+
+    sys.exit(1 if failed.any() else 0)
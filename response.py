@@ -6,79 +6,265 @@ To run the 'colour categorisation' experiment, see main.py.
 made by Anna van Harmelen, 2025
 """
 
-from psychopy import visual, event
-from psychopy.hardware.keyboard import Keyboard
-from time import time
 import numpy as np
-import random
+import os
+import tracemalloc
+from colourspace import (
+    calibration_hash,
+    colour_table_name,
+    get_calibration,
+    load_colour_table,
+)
 
 
 RADIUS_COLOUR_WHEEL = 3  # 6
 INNER_RADIUS_COLOUR_WHEEL = 2.25  # 4.5
 
+# A frame counts as dropped when it took this many refresh periods or longer
+DROPPED_FRAME_THRESHOLD = 1.2
+
+# Saturation of each block type, 0 to 1
+SATURATIONS = {"low": 0.2, "medium": 0.5, "high": 1}
+
+# Wheel textures that have already been generated, per saturation level
+_wheel_textures = {}
+
+# Seconds of flip times kept per response before the buffer has to grow
+FLIP_BUFFER_DURATION = 60
+
+# Frames kept of each traced allocation, enough to reach get_response from
+# inside PsychoPy's drawing code
+ALLOCATION_TRACE_DEPTH = 64
+
+
+class Colours:
+    """
+    The colours of the wheel as [hue, saturation, value], for hues 0 to
+    n_colours - 1 spread evenly over 360 degrees. Colours are made when they
+    are looked up, so a wheel of any resolution is set up at once.
+    """
+
+    __slots__ = ("n_colours", "saturation")
+
+    def __init__(self, n_colours, saturation):
+        self.n_colours = n_colours
+        self.saturation = saturation
+
+    def __len__(self):
+        return self.n_colours
+
+    def __getitem__(self, hue):
+        if isinstance(hue, slice):
+            return [self[i] for i in range(*hue.indices(self.n_colours))]
+        if not -self.n_colours <= hue < self.n_colours:
+            raise IndexError("Hue out of range.")
+
+        return [hue % self.n_colours, self.saturation, 0.5]
+
 
 def create_colours(n_colours, saturation, just_one=False):
-    if saturation not in ["low", "medium", "high"]:
+    if saturation not in SATURATIONS:
         raise ValueError("Saturation must be 'low', 'medium', or 'high'.")
     else:
-        saturation = {"low": 0.2, "medium": 0.5, "high": 1}[saturation]
+        saturation = SATURATIONS[saturation]
 
     if just_one:
         return [just_one, saturation, 0.5]
 
-    return [[hue, saturation, 0.5] for hue in range(n_colours)]
+    return Colours(n_colours, saturation)
+
+
+def get_pooled(settings, key, create):
+    # Make each stimulus once per session, after that only its properties change
+    pool = settings.setdefault("pool", {})
+    if key not in pool:
+        pool[key] = create()
+    return pool[key]
+
+
+def get_colour_table(saturation, settings):
+    # RGB value of every hue, so colours are never converted while drawing
+    return load_colour_table(settings["n_colours"], SATURATIONS[saturation], settings)
+
+
+def create_wheel_texture(saturation, settings):
+    # Parameters for the colour wheel
+    radius = settings["deg2pix"](RADIUS_COLOUR_WHEEL)
+    inner_radius = settings["deg2pix"](INNER_RADIUS_COLOUR_WHEEL)
+    name = colour_table_name(settings["n_colours"], SATURATIONS[saturation], settings)
+    key = (name, radius, inner_radius)
+
+    if key in _wheel_textures:
+        return _wheel_textures[key]
+
+    # Try to load a texture generated in an earlier session
+    cache_file = os.path.join(
+        settings["directory"],
+        "cache",
+        f"colour_wheel_{name}_{radius}_{inner_radius}.npz",
+    )
+    if os.path.exists(cache_file):
+        with np.load(cache_file) as cached:
+            _wheel_textures[key] = cached["image"], cached["mask"]
+        return _wheel_textures[key]
+
+    # Position of each texel centre, row 0 is the bottom row of the image
+    coordinates = np.arange(2 * radius) - radius + 0.5
+    x, y = np.meshgrid(coordinates, coordinates)
+
+    # Same angle -> colour rule as get_colour, for a wheel without offset
+    angle = np.degrees(np.arctan2(y, x)) % 360
+    hue_ids = angles_to_hues(angle, 0, settings["n_colours"])
+    image = get_colour_table(saturation, settings)[hue_ids]
+
+    # Only show the donut, everything else is transparent
+    distance = np.hypot(x, y)
+    mask = np.where((distance >= inner_radius) & (distance <= radius), 1, -1).astype(
+        np.float32
+    )
+
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    np.savez_compressed(cache_file, image=image, mask=mask)
+
+    _wheel_textures[key] = image, mask
+    return _wheel_textures[key]
 
 
 def create_colour_wheel(offset, saturation, settings):
     # Determine colour range
     colours = create_colours(settings["n_colours"], saturation)
 
+    if settings["wheel_mode"] == "texture":
+        # Build the image for this saturation once, then only rotate it
+        wheel_image = get_pooled(
+            settings,
+            ("wheel_image", saturation),
+            lambda: create_wheel_image(saturation, settings),
+        )
+
+        # Psychopy rotates clockwise, the wheel's offset goes counter-clockwise
+        wheel_image.ori = -offset
+
+        return [wheel_image], colours
+
+    # Make the wedges of this saturation once, then only rotate them
+    colour_wheel = get_pooled(
+        settings, ("wedges", saturation), lambda: create_wedges(saturation, settings)
+    )
+    for wedge in colour_wheel:
+        wedge.ori = -offset
+
+    return colour_wheel, colours
+
+
+def create_wheel_image(saturation, settings):
+    image, mask = create_wheel_texture(saturation, settings)
+    wheel_image = settings["visual"].ImageStim(
+        settings["window"],
+        image=image,
+        mask=mask,
+        size=image.shape[:2],
+        interpolate=False,
+    )
+    settings["profiler"].count("stimuli_created")
+
+    return wheel_image
+
+
+def create_wedges(saturation, settings):
     # Parameters for the colour wheel
     radius = settings["deg2pix"](RADIUS_COLOUR_WHEEL)
     inner_radius = settings["deg2pix"](INNER_RADIUS_COLOUR_WHEEL)
 
-    # Draw the colour wheel using segments
+    # Draw the colour wheel using segments, one per hue, so unlike the texture
+    # this gets slower as the number of colours grows
+    colour_table = get_colour_table(saturation, settings)
+    step = 360 / settings["n_colours"]
     colour_wheel = []
     for i in range(settings["n_colours"]):
         # Create a wedge for each segment
-        wedge = visual.ShapeStim(
+        wedge = settings["visual"].ShapeStim(
             settings["window"],
             vertices=[
                 [
-                    inner_radius * np.cos(np.radians(i + offset)),
-                    inner_radius * np.sin(np.radians(i + offset)),
+                    inner_radius * np.cos(np.radians(i * step)),
+                    inner_radius * np.sin(np.radians(i * step)),
                 ],
                 [
-                    radius * np.cos(np.radians(i + offset)),
-                    radius * np.sin(np.radians(i + offset)),
+                    radius * np.cos(np.radians(i * step)),
+                    radius * np.sin(np.radians(i * step)),
                 ],
                 [
-                    radius * np.cos(np.radians(i + 1 + offset)),
-                    radius * np.sin(np.radians(i + 1 + offset)),
+                    radius * np.cos(np.radians((i + 1) * step)),
+                    radius * np.sin(np.radians((i + 1) * step)),
                 ],
                 [
-                    inner_radius * np.cos(np.radians(i + 1 + offset)),
-                    inner_radius * np.sin(np.radians(i + 1 + offset)),
+                    inner_radius * np.cos(np.radians((i + 1) * step)),
+                    inner_radius * np.sin(np.radians((i + 1) * step)),
                 ],
             ],
-            fillColor=colours[i],
+            fillColor=colour_table[i],
             lineColor=None,
-            colorSpace="hsv",
         )
         colour_wheel.append(wedge)
 
-    return colour_wheel, colours
+    settings["profiler"].count("stimuli_created", len(colour_wheel))
+
+    return colour_wheel
+
+
+def capture_static_layer(stimuli, settings):
+    # Render the stimuli once, and read back the area the colour wheel covers
+    radius = settings["deg2pix"](RADIUS_COLOUR_WHEEL) + 1
+    width, height = settings["window"].size
+    for stimulus in stimuli:
+        stimulus.draw()
+    region = settings["window"]._getRegionOfFrame(
+        rect=(
+            -2 * radius / width,
+            2 * radius / height,
+            2 * radius / width,
+            -2 * radius / height,
+        ),
+        buffer="back",
+    )
+
+    # Copy it into the same image every trial, so no new texture is made
+    static_layer = get_pooled(
+        settings,
+        "static_layer",
+        lambda: create_static_layer(region, 2 * radius, settings),
+    )
+    static_layer.image = region
+
+    # Nothing of this should end up on the next frame
+    settings["window"].clearBuffer()
+
+    return static_layer
+
+
+def create_static_layer(image, size, settings):
+    static_layer = settings["visual"].ImageStim(
+        settings["window"],
+        image=image,
+        size=(size, size),
+        interpolate=False,
+    )
+    settings["profiler"].count("stimuli_created")
+
+    return static_layer
 
 
 def make_marker(radius, inner_radius, settings):
     # Create a marker for the selected colour preview
-    marker = visual.Rect(
+    marker = settings["visual"].Rect(
         settings["window"],
         width=15,
         height=settings["deg2pix"](radius - inner_radius),
         fillColor=None,
         lineColor=(1, 1, 1),
     )
+    settings["profiler"].count("stimuli_created")
 
     return marker
 
@@ -89,18 +275,27 @@ def get_colour(mouse_pos, offset, colours):
 
     # Determine current colour based on mouse position
     angle = (np.degrees(np.arctan2(mouse_y, mouse_x)) + 360) % 360
-    colour_angle = angle - offset
-    if colour_angle > 360:
-        colour_angle -= 360
-    current_colour = colours[int(colour_angle)]
+    colour_angle = (angle - offset) % 360
+    current_colour = colours[int(colour_angle * len(colours) / 360) % len(colours)]
 
     return current_colour, angle
 
 
-def move_marker(marker, mouse_pos, offset, colours, radius, inner_radius, settings):
+def move_marker(
+    marker,
+    mouse_pos,
+    offset,
+    colours,
+    radius,
+    inner_radius,
+    settings,
+    colour_table=None,
+):
     # Get current selected colour and use for marker
     current_colour, angle = get_colour(mouse_pos, offset, colours)
-    marker.fillColor = current_colour
+    if colour_table is None:
+        colour_table = load_colour_table(len(colours), current_colour[1], settings)
+    marker.fillColor = colour_table[current_colour[0] % len(colour_table)]
 
     # Fix the marker's position to the colour wheel's radius
     marker.pos = (
@@ -116,22 +311,56 @@ def move_marker(marker, mouse_pos, offset, colours, radius, inner_radius, settin
     return current_colour
 
 
+def angles_to_hues(angles, offsets, n_colours=360):
+    # Same angle -> colour rule as get_colour, for whole arrays of responses
+    colour_angles = (np.asarray(angles) - np.asarray(offsets)) % 360
+    return (colour_angles * n_colours / 360).astype(int) % n_colours
+
+
+def score_responses(target_hues, selected_hues, n_colours=360):
+    # For whole arrays of responses, see evaluate_response for a single one.
+    # Hue ids are the positions of the colours on the colour wheel, distances
+    # are in hue steps (degrees when n_colours is 360)
+    target_hues = np.asarray(target_hues)
+    selected_hues = np.asarray(selected_hues)
+
+    # Calculate the distance between the two colours
+    abs_rgb_distance = np.abs(selected_hues - target_hues)
+
+    # Go the other way around the wheel when that is shorter
+    wrapped = abs_rgb_distance > n_colours / 2
+    rgb_distance = np.where(wrapped, n_colours - abs_rgb_distance, abs_rgb_distance)
+    rgb_distance_signed = np.where(
+        wrapped, abs_rgb_distance - n_colours, abs_rgb_distance
+    )
+
+    performance = np.round(100 - rgb_distance / (n_colours / 2) * 100).astype(int)
+
+    return {
+        "abs_rgb_distance": abs_rgb_distance,
+        "rgb_distance": rgb_distance,
+        "rgb_distance_signed": rgb_distance_signed,
+        "performance": performance,
+    }
+
+
 def evaluate_response(selected_colour, target_colour, colours):
-    # Determine position of both colours on colour wheel
-    selected_colour_id = colours.index(selected_colour) + 1
-    target_colour_id = colours.index(target_colour) + 1
+    # The hue of each colour is its position on the colour wheel, the same
+    # rules as score_responses but in plain ints, which is faster for one trial
+    n_colours = len(colours)
 
     # Calculate the distance between the two colours
-    abs_rgb_distance = abs(selected_colour_id - target_colour_id)
+    abs_rgb_distance = abs(selected_colour[0] - target_colour[0])
 
-    if abs_rgb_distance > 180:
-        rgb_distance = 360 - abs_rgb_distance
-        rgb_distance_signed = abs_rgb_distance - 360
+    # Go the other way around the wheel when that is shorter
+    if abs_rgb_distance > n_colours / 2:
+        rgb_distance = n_colours - abs_rgb_distance
+        rgb_distance_signed = abs_rgb_distance - n_colours
     else:
         rgb_distance = abs_rgb_distance
         rgb_distance_signed = abs_rgb_distance
 
-    performance = round(100 - rgb_distance / 180 * 100)
+    performance = round(100 - rgb_distance / (n_colours / 2) * 100)
 
     return {
         "abs_rgb_distance": abs_rgb_distance,
@@ -141,90 +370,238 @@ def evaluate_response(selected_colour, target_colour, colours):
     }
 
 
+def create_mouse(settings):
+    mouse = settings["event"].Mouse(visible=False, win=settings["window"])
+    settings["profiler"].count("mice_created")
+
+    return mouse
+
+
+def add_flip_time(flip_times, n_frames, time):
+    # Only grows the buffer if a response takes longer than it can hold
+    if n_frames == len(flip_times):
+        flip_times.resize(2 * len(flip_times), refcheck=False)
+    flip_times[n_frames] = time
+
+    return n_frames + 1
+
+
+def prepare_response(saturation, offset, settings):
+    # Prepare the colour wheel, rotated by the planned offset
+    with settings["profiler"].phase("wheel_construction"):
+        colour_wheel, colours = create_colour_wheel(offset, saturation, settings)
+
+    # The same mouse and marker are used on every trial, the mouse stays
+    # hidden until the response
+    with settings["profiler"].phase("trial_setup"):
+        mouse = get_pooled(settings, "mouse", lambda: create_mouse(settings))
+        marker = get_pooled(
+            settings,
+            "marker",
+            lambda: make_marker(
+                RADIUS_COLOUR_WHEEL, INNER_RADIUS_COLOUR_WHEEL, settings
+            ),
+        )
+
+    return {
+        "offset": offset,
+        "colour_wheel": colour_wheel,
+        "colours": colours,
+        "colour_table": get_colour_table(saturation, settings),
+        "mouse": mouse,
+        "marker": marker,
+    }
+
+
 def get_response(
     target_colour,
     target_item,
     saturation,
     settings,
+    prepared=None,
 ):
-    keyboard: Keyboard = settings["keyboard"]
+    keyboard = settings["keyboard"]
 
     # Check for pressed 'q'
     check_quit(keyboard)
 
-    # These timing systems should start at the same time, this is almost true
-    idle_reaction_time_start = time()
     keyboard.clock.reset()
 
-    # Prepare the colour wheel and initialise variables
-    offset = random.randint(0, 360)
-    colour_wheel, colours = create_colour_wheel(offset, saturation, settings)
-    mouse = event.Mouse(visible=True, win=settings["window"])
-    mouse.getPos()
-    marker = make_marker(RADIUS_COLOUR_WHEEL, INNER_RADIUS_COLOUR_WHEEL, settings)
-    marker.colorSpace = "hsv"
-    selected_colour = None
-
-    # Wait until participant starts moving the mouse
-    while not mouse.mouseMoved():
-        # Draw each wedge
-        for wedge in colour_wheel:
-            wedge.draw()
-
-        # Draw the central square
-        target_item.draw()
+    # Use the colour wheel prepared earlier, or make one now (without a plan,
+    # the wheel isn't rotated)
+    if prepared is None:
+        prepared = prepare_response(saturation, 0, settings)
+    offset = prepared["offset"]
+    colour_wheel = prepared["colour_wheel"]
+    colours = prepared["colours"]
+    marker = prepared["marker"]
+    mouse = prepared["mouse"]
+
+    # The wheel and target don't change, so draw them as one image if there is one
+    if prepared.get("static_layer"):
+        static_layer = [prepared["static_layer"]]
+    else:
+        static_layer = [*colour_wheel, target_item]
 
-        settings["window"].flip()
+    # Initialise variables
+    selected_colour = None
+    moved = False
+
+    # Flip times go in a buffer that's reused on every trial, instead of a
+    # list that grows with every frame
+    flip_times = get_pooled(
+        settings,
+        "flip_times",
+        lambda: np.zeros(FLIP_BUFFER_DURATION * settings["monitor"]["Hz"]),
+    )
+    n_frames = 0
 
-    response_started = time()
-    idle_reaction_time = response_started - idle_reaction_time_start
+    mouse.setVisible(True)
+    mouse.getPos()
+    if settings["sampler"]:
+        settings["sampler"].start_trial()
+    try:
+        # Trace what the loops below allocate, only when asked, because tracing
+        # makes every frame many times slower
+        if settings["trace_allocations"]:
+            tracemalloc.start(ALLOCATION_TRACE_DEPTH)
+
+        # Wait until participant starts moving the mouse
+        with settings["profiler"].phase("idle_loop"):
+            while not moved:
+                with settings["profiler"].phase("drawing"):
+                    # Draw the colour wheel and the central square
+                    for stimulus in static_layer:
+                        stimulus.draw()
+
+                # Timed apart, as waiting for the refresh would hide the draw cost
+                with settings["profiler"].phase("flip"):
+                    n_frames = add_flip_time(
+                        flip_times, n_frames, settings["window"].flip()
+                    )
+                settings["profiler"].count("frames")
+                settings["profiler"].count("draws", len(static_layer))
+                moved = mouse.mouseMoved()
+
+        # All timing is locked to the flip that preceded each event
+        response_started = flip_times[n_frames - 1]
+        idle_reaction_time = response_started - flip_times[0]
+
+        # Show colour wheel and get participant response
+        with settings["profiler"].phase("response_loop"):
+            while not selected_colour:
+                # Check for pressed 'q'
+                check_quit(keyboard)
+
+                with settings["profiler"].phase("drawing"):
+                    # Draw the colour wheel and the central square
+                    for stimulus in static_layer:
+                        stimulus.draw()
+
+                    # Move the marker
+                    current_colour = move_marker(
+                        marker,
+                        mouse.getPos(),
+                        offset,
+                        colours,
+                        RADIUS_COLOUR_WHEEL,
+                        INNER_RADIUS_COLOUR_WHEEL,
+                        settings,
+                        prepared["colour_table"],
+                    )
+
+                # Flip the display
+                with settings["profiler"].phase("flip"):
+                    n_frames = add_flip_time(
+                        flip_times, n_frames, settings["window"].flip()
+                    )
+                settings["profiler"].count("frames")
+                settings["profiler"].count("draws", len(static_layer) + 1)
+
+                # Check for mouse click
+                if mouse.getPressed()[0]:  # Left mouse click
+                    selected_colour = current_colour
+
+        if settings["trace_allocations"]:
+            allocations = count_loop_allocations()
+            settings["profiler"].count(
+                "allocated_blocks", allocations["n_allocated_blocks"]
+            )
+    finally:
+        # Stop recording and tracing also when the response was cut short by 'q'
+        if settings["trace_allocations"]:
+            tracemalloc.stop()
+        mouse.setVisible(False)
+        if settings["sampler"]:
+            settings["sampler"].stop_trial()
+
+    flip_times = flip_times[:n_frames]
+    response_time = flip_times[-1] - response_started
+
+    # Mark the events of this response in the gaze data, at their flips
+    if settings["eyetracker"]:
+        settings["eyetracker"].trigger("wheel_onset", flip_times[0])
+        settings["eyetracker"].trigger("movement_onset", response_started)
+        settings["eyetracker"].trigger("response", flip_times[-1])
+
+    with settings["profiler"].phase("scoring"):
+        scores = evaluate_response(selected_colour, target_colour, colours)
 
-    # Show colour wheel and get participant response
-    while not selected_colour:
-        # Check for pressed 'q'
-        check_quit(keyboard)
+    return {
+        "idle_reaction_time_in_ms": round(idle_reaction_time * 1000, 2),
+        "response_time_in_ms": round(response_time * 1000, 2),
+        "selected_colour": selected_colour,
+        "colour_wheel_offset": offset,
+        "n_colours": len(colours),
+        # Hue ids only mean the same colours with the same table, see colourspace.py
+        "colour_space": settings["colour_space"],
+        "calibration": calibration_hash(get_calibration(settings["monitor"])),
+        **(allocations if settings["trace_allocations"] else {}),
+        **scores,
+        **get_frame_stats(flip_times, settings["monitor"]["Hz"]),
+    }
 
-        # Draw each wedge
-        for wedge in colour_wheel:
-            wedge.draw()
 
-        # Draw the central square
-        target_item.draw()
+def count_loop_allocations():
+    """
+    Returns the memory blocks (and their bytes) the response loops allocated
+    and still hold. Only allocations made from this file on the main thread
+    count, not those of the writer, sampler or eyetracker threads.
+    Allocations that were freed again within a frame aren't counted. What's
+    left is mostly the state of the last frame (the marker's position and
+    colour, the selected colour), so the count shows whether that grows with
+    the number of frames, not that the loops allocate nothing.
+    """
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(True, __file__, all_frames=True)]
+    )
+    statistics = snapshot.statistics("traceback")
 
-        # Move the marker
-        current_colour = move_marker(
-            marker,
-            mouse.getPos(),
-            offset,
-            colours,
-            RADIUS_COLOUR_WHEEL,
-            INNER_RADIUS_COLOUR_WHEEL,
-            settings,
-        )
+    return {
+        "n_allocated_blocks": sum(statistic.count for statistic in statistics),
+        "n_allocated_bytes": sum(statistic.size for statistic in statistics),
+    }
 
-        # Flip the display
-        settings["window"].flip()
 
-        # Check for mouse click
-        if mouse.getPressed()[0]:  # Left mouse click
-            selected_colour = current_colour
+def get_frame_stats(flip_times, refresh_rate):
+    # Time between consecutive flips, in seconds
+    intervals = np.diff(flip_times)
+    if len(intervals) == 0:
+        intervals = np.zeros(1)
 
-    response_time = time() - response_started
-    mouse = event.Mouse(visible=False, win=settings["window"])
+    dropped = intervals >= DROPPED_FRAME_THRESHOLD / refresh_rate
 
     return {
-        "idle_reaction_time_in_ms": round(idle_reaction_time * 1000, 2),
-        "response_time_in_ms": round(response_time * 1000, 2),
-        "selected_colour": selected_colour,
-        "colour_wheel_offset": offset,
-        **evaluate_response(selected_colour, target_colour, colours),
+        "n_frames": len(flip_times),
+        "n_dropped_frames": int(dropped.sum()),
+        "max_frame_interval_in_ms": round(float(intervals.max()) * 1000, 2),
+        "mean_frame_interval_in_ms": round(float(intervals.mean()) * 1000, 2),
     }
 
 
-def wait_for_key(key_list, keyboard):
-    keyboard: Keyboard = keyboard
-    keyboard.clearEvents()
-    keys = event.waitKeys(keyList=key_list)
+def wait_for_key(key_list, settings):
+    settings["keyboard"].clearEvents()
+    keys = settings["event"].waitKeys(keyList=key_list)
 
     return keys
 
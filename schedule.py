@@ -0,0 +1,193 @@
+"""
+This file contains the functions necessary for
+generating counterbalanced block schedules for a whole cohort at once.
+To run the 'colour categorisation' experiment, see main.py.
+
+A schedule is the order of block types plus the target colours of each
+block. Schedules are generated in batches:
+ - block types occur equally often (up to one block difference)
+ - the same block type is never repeated more than max_run_length times
+ - all colours are used as equally often as possible per block type (on
+   wheels with many colours, each block type takes its colours from equal
+   parts of the wheel instead)
+ - each block takes one colour from each of n_trials equal parts of the
+   colour wheel, so its colours are spread over the whole wheel, and never
+   contains the same colour twice
+
+made by Anna van Harmelen, 2025
+"""
+
+import hashlib
+import os
+import numpy as np
+
+BLOCK_TYPES = ["low", "medium", "high"]
+MAX_RUN_LENGTH = 2
+
+# Schedules cached for all sessions of a study
+COHORT_SIZE = 1000
+COHORT_SEED = 2025
+
+MAX_ATTEMPTS = 1000
+
+# With more colours than this, colours are drawn from equal parts of the wheel
+# instead of shuffling all of them, so memory doesn't grow with the resolution
+MAX_SHUFFLED_COLOURS = 3600
+
+
+def generate_block_orders(rng, n_schedules, n_blocks, n_types, max_run_length):
+    # Spread the blocks over the types, random types get the leftover blocks
+    counts = np.full((n_schedules, n_types), n_blocks // n_types)
+    extra = np.argsort(rng.random((n_schedules, n_types)), axis=1)
+    counts[np.arange(n_schedules)[:, None], extra[:, : n_blocks % n_types]] += 1
+
+    # Type of each block, sorted, then shuffled per schedule
+    ends = np.cumsum(counts, axis=1)
+    orders = (np.arange(n_blocks)[None, :, None] >= ends[:, None, :]).sum(axis=2)
+
+    todo = np.arange(n_schedules)
+    for _ in range(MAX_ATTEMPTS):
+        shuffle = np.argsort(rng.random((len(todo), n_blocks)), axis=1)
+        orders[todo] = np.take_along_axis(orders[todo], shuffle, axis=1)
+
+        if max_run_length is None:
+            return orders
+
+        # Reshuffle the schedules with too many blocks of one type in a row
+        run = np.ones(len(todo), dtype=int)
+        longest = run.copy()
+        for block in range(1, n_blocks):
+            same = orders[todo, block] == orders[todo, block - 1]
+            run = np.where(same, run + 1, 1)
+            longest = np.maximum(longest, run)
+        todo = todo[longest > max_run_length]
+
+        if not len(todo):
+            return orders
+
+    raise Exception(
+        f"Could not order the blocks without more than {max_run_length} blocks "
+        "of the same type in a row."
+    )
+
+
+def generate_type_colours(
+    rng, n_schedules, n_types, n_type_blocks, n_trials, n_colours
+):
+    n_needed = n_type_blocks * n_trials
+    if n_colours > MAX_SHUFFLED_COLOURS and n_colours >= n_needed:
+        # One random colour from each of n_needed equal parts of the wheel
+        edges = np.arange(n_needed + 1) * n_colours // n_needed
+        widths = np.diff(edges)
+        offsets = rng.random((n_schedules, n_types, n_needed)) * widths
+        colours = edges[:-1] + offsets.astype(int)
+    else:
+        # Enough shuffled rounds of all colours to fill every block of a type
+        n_rounds = -(-n_needed // n_colours)
+        keys = rng.random((n_schedules, n_types, n_rounds, n_colours))
+        colours = np.argsort(keys, axis=-1).reshape(n_schedules, n_types, -1)[
+            ..., :n_needed
+        ]
+
+    # Cut the sorted colours into n_trials arcs of the colour wheel, and give
+    # each block of a type one colour from every arc
+    arcs = np.sort(colours, axis=-1).reshape(
+        n_schedules, n_types, n_trials, n_type_blocks
+    )
+    if n_needed > n_colours:
+        # Colours repeat, and the copies of a colour are next to each other,
+        # possibly in neighbouring arcs. Dealing the sorted colours out to the
+        # blocks in turn gives every copy to a different block, as there are
+        # never more copies of a colour than blocks of a type
+        shuffle = np.argsort(
+            rng.random((n_schedules, n_types, 1, n_type_blocks)), axis=-1
+        )
+        shuffle = np.broadcast_to(shuffle, arcs.shape)
+    else:
+        # All colours differ, so each block can take a random one from every arc
+        shuffle = np.argsort(rng.random(arcs.shape), axis=-1)
+    arcs = np.take_along_axis(arcs, shuffle, axis=-1)
+    blocks = arcs.swapaxes(-1, -2)
+
+    # Random order of the colours within each block
+    shuffle = np.argsort(rng.random(blocks.shape), axis=-1)
+    return np.take_along_axis(blocks, shuffle, axis=-1) + 1
+
+
+def generate_schedules(
+    n_schedules,
+    n_blocks,
+    n_trials,
+    n_colours,
+    block_types=BLOCK_TYPES,
+    max_run_length=MAX_RUN_LENGTH,
+    seed=None,
+):
+    """
+    Returns the block types (as indices into block_types) with shape
+    (n_schedules, n_blocks), and the target colours (1 to n_colours) with
+    shape (n_schedules, n_blocks, n_trials).
+    """
+    if n_trials > n_colours:
+        raise Exception(
+            "Expected number of trials to be at most the number of colours, "
+            "otherwise blocks would have to repeat colours."
+        )
+
+    rng = np.random.default_rng(seed)
+    n_types = len(block_types)
+    n_type_blocks = -(-n_blocks // n_types)
+
+    orders = generate_block_orders(rng, n_schedules, n_blocks, n_types, max_run_length)
+
+    type_colours = generate_type_colours(
+        rng, n_schedules, n_types, n_type_blocks, n_trials, n_colours
+    )
+
+    # The n-th block of a type gets that type's n-th set of colours
+    occurrence = np.cumsum(orders[:, :, None] == np.arange(n_types), axis=1) - 1
+    occurrence = np.take_along_axis(occurrence, orders[:, :, None], axis=2)[..., 0]
+    colours = type_colours[np.arange(n_schedules)[:, None], orders, occurrence]
+
+    return orders.astype(np.int8), colours
+
+
+def load_schedules(
+    directory,
+    n_blocks,
+    n_trials,
+    n_colours,
+    block_types=BLOCK_TYPES,
+    max_run_length=MAX_RUN_LENGTH,
+    n_schedules=COHORT_SIZE,
+    seed=COHORT_SEED,
+):
+    # Generate the cohort's schedules once, then reuse them for every session
+    parameters = repr(
+        (
+            n_blocks,
+            n_trials,
+            n_colours,
+            list(block_types),
+            max_run_length,
+            n_schedules,
+            seed,
+        )
+    )
+    cache_file = os.path.join(
+        directory,
+        "cache",
+        f"schedules_{hashlib.sha1(parameters.encode()).hexdigest()[:12]}.npz",
+    )
+
+    if os.path.exists(cache_file):
+        with np.load(cache_file) as cached:
+            return cached["orders"], cached["colours"]
+
+    orders, colours = generate_schedules(
+        n_schedules, n_blocks, n_trials, n_colours, block_types, max_run_length, seed
+    )
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    np.savez_compressed(cache_file, orders=orders, colours=colours)
+
+    return orders, colours
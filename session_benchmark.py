@@ -0,0 +1,42 @@
+"""
+This file contains the functions necessary for
+running a full session without screen, mouse or keyboard,
+to measure how long each phase of a trial takes.
+To run the 'colour categorisation' experiment, see main.py.
+
+Usage: python session_benchmark.py [--blocks N] [--eyetracking NAME]
+
+made by Anna van Harmelen, 2025
+"""
+
+import argparse
+import tempfile
+from time import perf_counter
+from main import main
+
+
+def run_session(blocks=None, eyetracking=None):
+    with tempfile.TemporaryDirectory() as directory:
+        start = perf_counter()
+        main(
+            testing=True,
+            backend="headless",
+            directory=directory,
+            test_blocks=blocks,
+            profile=True,
+            eyetracking=eyetracking,
+        )
+        print(f"\nTotal wall time: {perf_counter() - start:.3f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--blocks", type=int, default=None, help="number of blocks, default all"
+    )
+    parser.add_argument(
+        "--eyetracking", default=None, help='eyetracker to use, for example "mock"'
+    )
+    arguments = parser.parse_args()
+
+    run_session(arguments.blocks, arguments.eyetracking)
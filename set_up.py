@@ -6,11 +6,18 @@ To run the 'colour categorisation' experiment, see main.py.
 made by Anna van Harmelen, 2025
 """
 
-from psychopy import visual
-from psychopy.hardware.keyboard import Keyboard
+from backend import get_backend
+from profiling import Profiler, NullProfiler
+from trial import prerender_feedback, prepare_trial, show_text
+from response import SATURATIONS
+from feed import FEED_PORT
 from math import degrees, atan2
+import string
 import numpy as np
 
+# Blank frames shown at the end of the warm-up, so frame timing has settled
+WARM_UP_FLIPS = 60
+
 
 def get_monitor_and_dir(testing: bool):
     if testing:
@@ -38,26 +45,77 @@ def get_monitor_and_dir(testing: bool):
     return monitor, directory
 
 
-def get_settings(monitor: dict, directory):
+def get_deg2pix(monitor: dict):
+    # Calculate number of visual degrees per pixel on the screen
+    degrees_per_pixel = degrees(atan2(0.5 * monitor["width"], monitor["distance"])) / (
+        0.5 * monitor["resolution"][0]
+    )
+
+    return lambda deg: round(deg / degrees_per_pixel)
+
+
+def get_settings(
+    monitor: dict, directory, backend="psychopy", profile=False, eyetracking=None
+):
+    # Load either psychopy or its headless stand-in
+    backend = get_backend(backend)
+
     # Initialise psychopy window
-    window = visual.Window(
+    window = backend.visual.Window(
         color=([-0.5, -0.5, -0.5]),
         size=monitor["resolution"],
         units="pix",
         fullscr=True,
     )
 
-    # Calculate number of visual degrees per pixel on the screen
-    degrees_per_pixel = degrees(atan2(0.5 * monitor["width"], monitor["distance"])) / (
-        0.5 * monitor["resolution"][0]
-    )
-
-    return dict(
-        deg2pix=lambda deg: round(deg / degrees_per_pixel),
+    settings = dict(
+        deg2pix=get_deg2pix(monitor),
         window=window,
-        keyboard=Keyboard(),
-        mouse=visual.CustomMouse(win=window, visible=False),
+        keyboard=backend.Keyboard(),
+        mouse=backend.visual.CustomMouse(win=window, visible=False),
+        visual=backend.visual,
+        event=backend.event,
+        core=backend.core,
+        profiler=Profiler() if profile else NullProfiler(),
         monitor=monitor,
         directory=directory,
-        n_colours=360,
+        n_colours=360,  # hues on the wheel, any number with the "texture" wheel
+        colour_space="cielab",  # "cielab" or "hsv", see colourspace.py
+        wheel_mode="texture",  # "texture" or "wedges"
+        static_layer=True,  # draw the wheel and target as one captured image
+        trace_allocations=False,  # count what the response loops allocate, slow
+        record_trajectories=True,
+        mouse_sample_rate=1000,  # in Hz
+        sampler=None,  # set by main once the experiment starts
+        eyetracking=eyetracking,  # None, or a name in eyetracker.TRACKERS
+        eyetracker=None,  # set by main once the experiment starts
+        feed_port=FEED_PORT,  # port to send live results to, None to send nothing
+        gc_control=True,  # only collect garbage during feedback and breaks
     )
+
+    # Prepare the feedback scores before the first trial
+    prerender_feedback(settings)
+
+    return settings
+
+
+def warm_up(settings):
+    # Draw every kind of stimulus once, so textures, shaders and the wheel of
+    # each saturation level are ready, but clear it instead of showing it
+    for saturation in SATURATIONS:
+        prepared = prepare_trial(1, saturation, 0, settings)
+        for stimulus in prepared["colour_wheel"]:
+            stimulus.draw()
+        prepared["target_item"].draw()
+        prepared["marker"].fillColor = prepared["colour_table"][0]
+        prepared["marker"].draw()
+        settings["window"].clearBuffer()
+
+    # Render all characters the instructions and scores use
+    show_text(string.ascii_letters + string.digits + string.punctuation, settings)
+    for feedback in settings["feedback_text"].values():
+        feedback.draw()
+    settings["window"].clearBuffer()
+
+    for _ in range(WARM_UP_FLIPS):
+        settings["window"].flip()
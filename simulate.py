@@ -0,0 +1,209 @@
+"""
+This file contains the functions necessary for
+simulating observers doing the experiment, to plan the number of blocks.
+To run the 'colour categorisation' experiment, see main.py.
+
+Simulated observers remember each target shifted towards the nearest
+category prototype, with von Mises noise that depends on the saturation
+level, and sometimes guess. Their responses are given on a rotated wheel and
+scored like real responses. A study is a group of simulated participants; the
+power is the fraction of studies in which a sign-flip test finds the bias
+towards the prototypes, per saturation level.
+
+Usage: python simulate.py [--blocks N] [--trials N] [--participants N]
+                          [--studies N] [--colours N] [--bias B]
+                          [--workers N] [--seed N]
+
+made by Anna van Harmelen, 2025
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+from main import N_BLOCKS, TRIALS_PER_BLOCK
+from response import angles_to_hues, score_responses
+from schedule import BLOCK_TYPES, generate_schedules
+
+OBSERVER = {
+    "prototypes": [0, 60, 120, 180, 240, 300],  # in degrees on the colour wheel
+    "bias": 0.1,  # fraction of the way to the nearest prototype
+    "kappa": {"low": 4, "medium": 8, "high": 16},  # von Mises precision
+    "guess_rate": 0.05,
+}
+
+N_PERMUTATIONS = 1000
+ALPHA = 0.05
+
+# Studies simulated by one process at a time
+STUDIES_PER_TASK = 50
+
+
+def nearest_prototype_shift(targets, prototypes):
+    # Signed distance (in degrees) from each target to its nearest prototype
+    differences = (np.asarray(prototypes) - targets[..., None] + 180) % 360 - 180
+    nearest = np.argmin(np.abs(differences), axis=-1)
+    return np.take_along_axis(differences, nearest[..., None], axis=-1)[..., 0]
+
+
+def simulate_responses(rng, target_hues, block_types, n_colours, observer):
+    """
+    Returns the selected hue and the colour wheel offset of each target, for
+    targets (hue ids) of any shape; block_types are indices into BLOCK_TYPES.
+    """
+    targets = target_hues * 360 / n_colours
+    remembered = targets + observer["bias"] * nearest_prototype_shift(
+        targets, observer["prototypes"]
+    )
+
+    # Noise that depends on the saturation, and some random guesses
+    kappa = np.array([observer["kappa"][kind] for kind in BLOCK_TYPES])[block_types]
+    responses = remembered + np.degrees(rng.vonmises(0, kappa))
+    guesses = rng.random(targets.shape) < observer["guess_rate"]
+    responses = np.where(guesses, rng.random(targets.shape) * 360, responses)
+
+    # Click on a wheel rotated like in the experiment
+    offsets = rng.integers(0, 361, targets.shape)
+    selected_hues = angles_to_hues(responses + offsets, offsets, n_colours)
+
+    return selected_hues, offsets
+
+
+def simulate_sessions(rng, orders, colours, n_colours, observer):
+    """
+    Simulates one session per schedule, with orders and colours as returned by
+    generate_schedules. Returns the mean bias towards the prototypes (in
+    degrees) and the mean performance, per session and block type.
+    """
+    block_types = np.broadcast_to(orders[:, :, None], colours.shape)
+    selected_hues, _ = simulate_responses(
+        rng, colours, block_types, n_colours, observer
+    )
+    performance = score_responses(colours, selected_hues, n_colours)["performance"]
+
+    # Response errors, positive when towards the nearest prototype
+    targets = colours * 360 / n_colours
+    errors = ((selected_hues - colours) * 360 / n_colours + 180) % 360 - 180
+    towards = np.sign(nearest_prototype_shift(targets, observer["prototypes"]))
+
+    bias = np.zeros((len(orders), len(BLOCK_TYPES)))
+    mean_performance = np.zeros((len(orders), len(BLOCK_TYPES)))
+    for kind in range(len(BLOCK_TYPES)):
+        in_type = block_types == kind
+        n_trials = np.maximum(in_type.sum(axis=(1, 2)), 1)
+        mean_performance[:, kind] = (in_type * performance).sum(axis=(1, 2)) / n_trials
+
+        # Targets on a prototype can't be biased
+        in_type &= towards != 0
+        n_trials = np.maximum(in_type.sum(axis=(1, 2)), 1)
+        bias[:, kind] = (in_type * errors * towards).sum(axis=(1, 2)) / n_trials
+
+    return bias, mean_performance
+
+
+def sign_flip_p_values(rng, values, n_permutations=N_PERMUTATIONS):
+    """
+    Two-sided p-value of the mean of each row of values being different from
+    zero, from randomly flipping the sign of each value.
+    """
+    observed = np.abs(values.mean(axis=-1))
+    exceeded = np.zeros(observed.shape)
+    for _ in range(n_permutations):
+        signs = rng.choice([-1, 1], size=values.shape)
+        exceeded += np.abs((signs * values).mean(axis=-1)) >= observed
+
+    return (exceeded + 1) / (n_permutations + 1)
+
+
+def simulate_studies(
+    seed, n_studies, n_participants, n_blocks, n_trials, n_colours, observer
+):
+    # One session per participant, each with its own schedule
+    rng = np.random.default_rng(seed)
+    orders, colours = generate_schedules(
+        n_studies * n_participants, n_blocks, n_trials, n_colours, seed=rng
+    )
+    bias, performance = simulate_sessions(rng, orders, colours, n_colours, observer)
+
+    # Test every study and saturation level separately
+    bias = bias.reshape(n_studies, n_participants, -1).swapaxes(1, 2)
+    p_values = sign_flip_p_values(rng, bias)
+
+    return p_values, bias.mean(axis=-1), performance.mean(axis=0)
+
+
+def power_analysis(
+    n_blocks,
+    n_trials,
+    n_participants,
+    n_studies,
+    n_colours=360,
+    observer=OBSERVER,
+    alpha=ALPHA,
+    workers=None,
+    seed=None,
+):
+    """
+    Returns, per block type, the power to find the bias towards the
+    prototypes, the mean bias (in degrees) and the mean performance.
+    """
+    seeds = np.random.SeedSequence(seed).spawn(-(-n_studies // STUDIES_PER_TASK))
+    tasks = [
+        min(STUDIES_PER_TASK, n_studies - i * STUDIES_PER_TASK)
+        for i in range(len(seeds))
+    ]
+
+    # Every process simulates a few studies at a time
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        simulate = partial(
+            simulate_studies,
+            n_participants=n_participants,
+            n_blocks=n_blocks,
+            n_trials=n_trials,
+            n_colours=n_colours,
+            observer=observer,
+        )
+        results = list(pool.map(simulate, seeds, tasks))
+
+    p_values = np.concatenate([p for p, _, _ in results])
+    bias = np.concatenate([b for _, b, _ in results])
+    performance = np.average([p for _, _, p in results], axis=0, weights=tasks)
+
+    return {
+        kind: {
+            "power": (p_values[:, i] < alpha).mean(),
+            "mean_bias": bias[:, i].mean(),
+            "mean_performance": performance[i],
+        }
+        for i, kind in enumerate(BLOCK_TYPES)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--blocks", type=int, default=N_BLOCKS)
+    parser.add_argument("--trials", type=int, default=TRIALS_PER_BLOCK)
+    parser.add_argument("--participants", type=int, default=30)
+    parser.add_argument("--studies", type=int, default=1000)
+    parser.add_argument("--colours", type=int, default=360)
+    parser.add_argument("--bias", type=float, default=OBSERVER["bias"])
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    arguments = parser.parse_args()
+
+    results = power_analysis(
+        arguments.blocks,
+        arguments.trials,
+        arguments.participants,
+        arguments.studies,
+        arguments.colours,
+        {**OBSERVER, "bias": arguments.bias},
+        workers=arguments.workers,
+        seed=arguments.seed,
+    )
+    for kind, result in results.items():
+        print(
+            f"{kind:<8} power: {result['power']:.3f}, "
+            f"mean bias: {result['mean_bias']:.2f} degrees, "
+            f"mean performance: {result['mean_performance']:.1f}"
+        )
@@ -0,0 +1,175 @@
+"""
+This file contains the functions necessary for
+storing trial data in typed, columnar files and finding it again.
+To run the 'colour categorisation' experiment, see main.py.
+
+Each session's .csv is converted to data_session_<n>.parquet at the end of
+the session, and listed in session_index.parquet with its participant, so
+loading a selection of trials only reads the files it needs.
+
+made by Anna van Harmelen, 2025
+"""
+
+import os
+import pandas as pd
+
+INDEX_FILE = "session_index.parquet"
+SATURATION_LEVELS = ["low", "medium", "high"]
+
+# Sessions from before the wheel's resolution could be changed used 360 hues
+DEFAULT_N_COLOURS = 360
+
+# Storage type of each known column, other columns keep the type pandas picks
+COLUMN_TYPES = {
+    "participant_number": "int16",
+    "session_number": "int32",
+    "trial_number": "int16",
+    "block": "int16",
+    "block_type": pd.CategoricalDtype(SATURATION_LEVELS),
+    "target_colour": "int32",
+    "selected_hue": "int32",
+    "selected_saturation": "float32",
+    "selected_value": "float32",
+    "colour_wheel_offset": "int16",
+    "n_colours": "int32",
+    "colour_space": "category",
+    "n_allocated_blocks": "int32",
+    "n_allocated_bytes": "int64",
+    "idle_reaction_time_in_ms": "float32",
+    "response_time_in_ms": "float32",
+    "abs_rgb_distance": "int32",
+    "rgb_distance": "int32",
+    "rgb_distance_signed": "int32",
+    "performance": "int16",
+    "n_frames": "int32",
+    "n_dropped_frames": "int32",
+    "max_frame_interval_in_ms": "float32",
+    "mean_frame_interval_in_ms": "float32",
+}
+
+
+def parse_trials(data: pd.DataFrame):
+    """
+    Returns the trials as saved in a session's .csv, with the selected colour
+    split into selected_hue, selected_saturation and selected_value, and the
+    number of colours filled in for sessions from before it was saved.
+    """
+    data = data.copy()
+
+    # Selected colours are saved as "[hue, saturation, value]"
+    if "selected_colour" in data:
+        selected = (
+            data.pop("selected_colour")
+            .str.strip("[]")
+            .str.split(",", expand=True)
+            .astype(float)
+        )
+        data["selected_hue"] = selected[0].astype(int)
+        data["selected_saturation"] = selected[1]
+        data["selected_value"] = selected[2]
+
+    data["n_colours"] = (
+        data["n_colours"].fillna(DEFAULT_N_COLOURS).astype(int)
+        if "n_colours" in data
+        else DEFAULT_N_COLOURS
+    )
+
+    return data
+
+
+def convert_session(data: pd.DataFrame, participant, session):
+    data = data.copy()
+    data.insert(0, "participant_number", participant)
+    data.insert(1, "session_number", session)
+
+    # Times since the start of the experiment, saved as "h:mm:ss.ffffff"
+    for column in ["start_time", "end_time"]:
+        if column in data:
+            data[column] = pd.to_timedelta(data[column]).dt.total_seconds()
+
+    data = parse_trials(data)
+
+    return data.astype(
+        {column: kind for column, kind in COLUMN_TYPES.items() if column in data}
+    )
+
+
+def write_session(csv_path, directory, participant, session, testing=False):
+    name = f"data_session_{session}{'_test' if testing else ''}.parquet"
+    data = convert_session(pd.read_csv(csv_path), participant, session)
+    data.to_parquet(os.path.join(directory, name), index=False)
+
+    # Replace this session's entry in the index, if it's already there
+    index = load_index(directory)
+    index = index[~((index.session_number == session) & (index.testing == testing))]
+    entry = pd.DataFrame(
+        {
+            "participant_number": [participant],
+            "session_number": [session],
+            "testing": [testing],
+            "file": [name],
+            "n_trials": [len(data)],
+            "block_types": [",".join(data.block_type.unique().astype(str))],
+        }
+    )
+    index = pd.concat([index, entry], ignore_index=True).astype(
+        {"participant_number": "int16", "session_number": "int32", "n_trials": "int32"}
+    )
+    index.to_parquet(os.path.join(directory, INDEX_FILE), index=False)
+
+
+def load_index(directory):
+    path = os.path.join(directory, INDEX_FILE)
+    if not os.path.exists(path):
+        return pd.DataFrame(
+            columns=[
+                "participant_number",
+                "session_number",
+                "testing",
+                "file",
+                "n_trials",
+                "block_types",
+            ]
+        )
+
+    return pd.read_parquet(path)
+
+
+def load_trials(
+    directory,
+    participants=None,
+    sessions=None,
+    block_types=None,
+    columns=None,
+    testing=False,
+):
+    """
+    Loads the trials of all sessions that match the filters, for example
+    load_trials(directory, participants=range(10, 41), block_types=["high"]).
+    Only files that contain matching trials are read.
+    """
+    index = load_index(directory)
+    index = index[index.testing == testing]
+    if participants is not None:
+        index = index[index.participant_number.isin(list(participants))]
+    if sessions is not None:
+        index = index[index.session_number.isin(list(sessions))]
+    if block_types is not None:
+        index = index[
+            index.block_types.str.split(",").apply(
+                lambda types: any(kind in types for kind in block_types)
+            )
+        ]
+
+    filters = [("block_type", "in", list(block_types))] if block_types else None
+    if columns is not None and block_types is not None and "block_type" not in columns:
+        columns = [*columns, "block_type"]
+
+    frames = [
+        pd.read_parquet(os.path.join(directory, file), columns=columns, filters=filters)
+        for file in index.file
+    ]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,200 @@
+"""
+This file contains the functions necessary for
+recording the mouse trajectory of every response.
+To run the 'colour categorisation' experiment, see main.py.
+
+Samples of all trials are saved in one binary file per session, next to an
+index with the position of each trial in that file:
+ - trajectories_session_<n>.bin: TRAJECTORY_DTYPE records
+ - trajectories_session_<n>_index.npy: INDEX_DTYPE records, one per trial
+
+made by Anna van Harmelen, 2025
+"""
+
+import os
+import threading
+from time import sleep
+import numpy as np
+
+TRAJECTORY_DTYPE = np.dtype(
+    [("time", "f8"), ("x", "f4"), ("y", "f4"), ("buttons", "u1")]
+)
+INDEX_DTYPE = np.dtype([("trial_number", "i4"), ("offset", "i8"), ("n_samples", "i4")])
+
+# Longest response that can be recorded completely, in seconds
+MAX_TRIAL_DURATION = 60
+
+
+class MouseSampler:
+    """
+    Samples the mouse from a background thread at a fixed rate, independent of
+    the screen refresh. Samples go into preallocated arrays and are written to
+    disk by the same thread once a trial has finished. The sampler needs a
+    mouse of its own: reading the position of the trial's mouse would reset
+    the position its mouseMoved() compares to.
+    """
+
+    def __init__(self, directory, session, clock, mouse, rate=1000, n_trials=None):
+        self.clock = clock
+        self.mouse = mouse
+        self.period = 1 / rate
+        self.data_path = os.path.join(directory, f"trajectories_session_{session}.bin")
+        self.index_path = os.path.join(
+            directory, f"trajectories_session_{session}_index.npy"
+        )
+
+        # One trial's worth of samples, reused for every trial
+        capacity = int(rate * MAX_TRIAL_DURATION)
+        self._time = np.zeros(capacity, dtype=np.float64)
+        self._x = np.zeros(capacity, dtype=np.float32)
+        self._y = np.zeros(capacity, dtype=np.float32)
+        self._buttons = np.zeros(capacity, dtype=np.uint8)
+        self._n_samples = 0
+
+        # Carry on from where an earlier run of this session stopped, keeping
+        # only its first n_trials trials when that's given
+        self._index = []
+        if os.path.exists(self.index_path):
+            self._index = np.load(self.index_path).tolist()
+        if n_trials is not None:
+            self._index = [trial for trial in self._index if trial[0] <= n_trials]
+        self._n_written = (
+            os.path.getsize(self.data_path) // TRAJECTORY_DTYPE.itemsize
+            if os.path.exists(self.data_path)
+            else 0
+        )
+        self._trial_number = self._index[-1][0] if self._index else 0
+        if n_trials is not None:
+            self._trial_number = n_trials
+        self._state = "idle"  # "idle", "recording" or "saving"
+        self._closing = False
+        self._error = None
+        self._condition = threading.Condition()
+
+        self._file = open(self.data_path, "ab")
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def start_trial(self):
+        with self._condition:
+            # The previous trial has to be saved before its buffer is reused
+            self._condition.wait_for(lambda: self._state == "idle")
+            self._check()
+            self._trial_number += 1
+            self._n_samples = 0
+            self._state = "recording"
+            self._condition.notify_all()
+
+    def stop_trial(self):
+        # The sampler thread saves the trial while the feedback is shown
+        with self._condition:
+            self._state = "saving"
+            self._condition.notify_all()
+
+    def close(self):
+        with self._condition:
+            # A response that was cut short is saved too
+            if self._state == "recording":
+                self._state = "saving"
+            self._closing = True
+            self._condition.notify_all()
+        self._thread.join()
+        self._file.close()
+
+        # Only report the error, closing happens while the session shuts down
+        if self._error:
+            print(
+                f"Mouse trajectories could not be saved to {self.data_path}: "
+                f"{self._error.__class__.__name__}: {self._error}"
+            )
+
+    def _check(self):
+        # Stop the experiment as soon as trajectories can't be recorded anymore
+        if self._error:
+            raise self._error
+
+    def _run(self):
+        while True:
+            # Sleep between trials, so the thread doesn't compete with drawing
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._state != "idle" or self._closing
+                )
+                if self._state == "idle":
+                    return
+                state = self._state
+
+            try:
+                if state == "recording":
+                    self._record()
+                else:
+                    self._save_trial()
+            except Exception as e:
+                self._error = e
+
+            # Whatever happened, the trial is done with
+            with self._condition:
+                if self._state == state or self._error:
+                    self._state = "idle"
+                self._condition.notify_all()
+
+    def _record(self):
+        next_sample = self.clock()
+
+        while self._state == "recording":
+            self._sample()
+
+            # Keep to the sampling rate, without drifting
+            next_sample += self.period
+            delay = next_sample - self.clock()
+            if delay > 0:
+                sleep(delay)
+            else:
+                next_sample = self.clock()
+
+    def _sample(self):
+        i = self._n_samples
+        if i == len(self._time):
+            return
+
+        x, y = self.mouse.getPos()
+        left, middle, right = self.mouse.getPressed()
+        self._time[i] = self.clock()
+        self._x[i] = x
+        self._y[i] = y
+        self._buttons[i] = left | middle << 1 | right << 2
+        self._n_samples = i + 1
+
+    def _save_trial(self):
+        n = self._n_samples
+        samples = np.empty(n, dtype=TRAJECTORY_DTYPE)
+        samples["time"] = self._time[:n]
+        samples["x"] = self._x[:n]
+        samples["y"] = self._y[:n]
+        samples["buttons"] = self._buttons[:n]
+        samples.tofile(self._file)
+        self._file.flush()
+
+        # Rewrite the (small) index, so it's complete even after a crash
+        self._index.append((self._trial_number, self._n_written, n))
+        self._n_written += n
+        np.save(self.index_path, np.array(self._index, dtype=INDEX_DTYPE))
+
+
+def load_trajectories(directory, session):
+    # Memory-map the samples, so only the trials that are used get read
+    data_path = os.path.join(directory, f"trajectories_session_{session}.bin")
+    if os.path.getsize(data_path) == 0:
+        samples = np.zeros(0, dtype=TRAJECTORY_DTYPE)
+    else:
+        samples = np.memmap(data_path, dtype=TRAJECTORY_DTYPE, mode="r")
+    index = np.load(
+        os.path.join(directory, f"trajectories_session_{session}_index.npy")
+    )
+
+    return samples, index
+
+
+def get_trajectory(samples, index, trial_number):
+    trial = index[index["trial_number"] == trial_number][0]
+    return samples[trial["offset"] : trial["offset"] + trial["n_samples"]]
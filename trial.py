@@ -7,50 +7,168 @@ To run the 'colour categorisation' experiment, see main.py.
 made by Anna van Harmelen, 2025
 """
 
-from psychopy import visual
-from response import create_colours, get_response, wait_for_key
-import numpy as np
-from time import sleep
-from random import randint
+import gc
+from response import (
+    capture_static_layer,
+    create_colours,
+    get_colour_table,
+    get_pooled,
+    get_response,
+    prepare_response,
+)
 
+# How long the feedback stays on screen, in seconds
+FEEDBACK_DURATION = 0.3
 
-def show_text(input, window, pos=(0, 0), colour="#ffffff"):
-    textstim = visual.TextStim(
-        win=window, font="Courier New", text=input, color=colour, pos=pos, height=22
-    )
 
-    textstim.draw()
+def get_text_stim(settings, pos=(0, 0), colour="#ffffff"):
+    font, height = "Courier New", 22
+
+    # Reuse one text stimulus per look, loading fonts is slow
+    key = (font, height, str(colour), tuple(pos))
+    text_stims = settings.setdefault("text_stims", {})
+    if key not in text_stims:
+        text_stims[key] = settings["visual"].TextStim(
+            win=settings["window"],
+            font=font,
+            text="",
+            color=colour,
+            pos=pos,
+            height=height,
+        )
+        settings["profiler"].count("stimuli_created")
+
+    return text_stims[key]
+
+
+def prerender_feedback(settings):
+    # Render every possible score up front, so no glyphs are rendered in a trial
+    settings["feedback_text"] = {
+        score: settings["visual"].TextStim(
+            win=settings["window"],
+            text=f"{score}",
+            font="Courier New",
+            height=22,
+            pos=(0, 0),
+            color=[-1, -1, -1],
+            bold=True,
+        )
+        for score in range(101)
+    }
+    settings["profiler"].count("stimuli_created", len(settings["feedback_text"]))
+
 
+def show_text(input, settings, pos=(0, 0), colour="#ffffff"):
+    textstim = get_text_stim(settings, pos, colour)
 
-def single_trial(target_colour_id, saturation, settings):
-    # Determine colour
-    target_colour = create_colours(1, saturation, just_one=target_colour_id)
+    # Changing the text renders it again, so only do that when it's different
+    if textstim.text != input:
+        textstim.text = input
 
-    # Create square to indicate target colour
-    target_item = visual.Rect(
+    textstim.draw()
+
+
+def create_target_item(settings):
+    target_item = settings["visual"].Rect(
         settings["window"],
         width=settings["deg2pix"](2),
         height=settings["deg2pix"](2),
-        fillColor=target_colour,
         lineColor=None,
-        colorSpace="hsv",
     )
+    settings["profiler"].count("stimuli_created")
+
+    return target_item
+
+
+def collect_garbage(settings):
+    # With automatic collection off, clean up while nothing has to be on time
+    if settings["gc_control"]:
+        with settings["profiler"].phase("garbage_collection"):
+            gc.collect()
+
+
+def prepare_trial(target_colour_id, saturation, offset, settings):
+    with settings["profiler"].phase("trial_setup"):
+        # Determine colour
+        target_colour = create_colours(1, saturation, just_one=target_colour_id)
+
+        # Colour the square that indicates the target colour
+        target_item = get_pooled(
+            settings, "target_item", lambda: create_target_item(settings)
+        )
+        target_item.fillColor = get_colour_table(saturation, settings)[
+            target_colour_id % settings["n_colours"]
+        ]
+
+    prepared = {
+        "target_colour_id": target_colour_id,
+        "saturation": saturation,
+        "target_colour": target_colour,
+        "target_item": target_item,
+        **prepare_response(saturation, offset, settings),
+    }
+
+    # Capture the wheel and target, so each frame only draws them as one image
+    if settings["static_layer"]:
+        with settings["profiler"].phase("static_layer"):
+            prepared["static_layer"] = capture_static_layer(
+                [*prepared["colour_wheel"], target_item], settings
+            )
+
+    return prepared
+
+
+def prefetch_trial(next_trial, settings):
+    # Prepare the next trial's stimuli while the participant looks at something else
+    if next_trial:
+        with settings["profiler"].phase("prefetch"):
+            settings["prefetched"] = prepare_trial(*next_trial, settings)
+
+
+def single_trial(target_colour_id, saturation, offset, settings, next_trial=None):
+    with settings["profiler"].phase("trial"):
+        if settings["eyetracker"]:
+            settings["eyetracker"].trigger("trial_start")
+
+        # Use the stimuli prepared during the previous feedback or break, if any
+        prepared = settings.pop("prefetched", None)
+        trial = (target_colour_id, saturation, offset)
+        if (
+            prepared is None
+            or (
+                prepared["target_colour_id"],
+                prepared["saturation"],
+                prepared["offset"],
+            )
+            != trial
+        ):
+            prepared = prepare_trial(*trial, settings)
+
+        # Run trial: get_response handles both the displaying and the response
+        response = get_response(
+            prepared["target_colour"],
+            prepared["target_item"],
+            saturation,
+            settings,
+            prepared,
+        )
+
+        # Give feedback
+        with settings["profiler"].phase("feedback"):
+            prepared["target_item"].draw()
+            settings["feedback_text"][response["performance"]].draw()
+            feedback_onset = settings["window"].flip()
+            if settings["eyetracker"]:
+                settings["eyetracker"].trigger("feedback", feedback_onset)
 
-    # Run trial: get_response handles both the displaying and the response
-    response = get_response(target_colour, target_item, saturation, settings)
-
-    # Give feedback
-    target_item.draw()
-    visual.TextStim(
-        win=settings["window"],
-        text=f"{response['performance']}",
-        font="Courier New",
-        height=22,
-        pos=(0, 0),
-        color=[-1, -1, -1],
-        bold=True,
-    ).draw()
-    settings["window"].flip()
-    sleep(0.3)
+            # Use the feedback time to set up the next trial and clean up, then
+            # wait for what's left
+            prefetch_trial(next_trial, settings)
+            collect_garbage(settings)
+            settings["core"].wait(
+                max(
+                    0, FEEDBACK_DURATION - (settings["core"].getTime() - feedback_onset)
+                )
+            )
 
     return response
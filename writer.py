@@ -0,0 +1,91 @@
+"""
+This file contains the functions necessary for
+saving trial data while the experiment is running.
+To run the 'colour categorisation' experiment, see main.py.
+
+made by Anna van Harmelen, 2025
+"""
+
+import csv
+import os
+import queue
+import threading
+
+# Messages to the writer thread besides trial rows
+_FLUSH = object()
+_STOP = object()
+
+
+class TrialWriter:
+    """
+    Appends trial rows to a .csv file from a background thread,
+    so the experiment itself never has to wait for the disk.
+    """
+
+    def __init__(self, path, n_trials=0):
+        self.path = path
+        self.n_trials = n_trials  # including trials already in the file
+        self._queue = queue.Queue()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, row: dict):
+        self._check()
+        self._queue.put(row)
+        self.n_trials += 1
+
+    def flush(self):
+        # Make sure everything written so far ends up on disk
+        self._check()
+        self._queue.put(_FLUSH)
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+        # Only report the error, closing happens while the session shuts down
+        if self._error:
+            print(
+                f"Trial data could not be saved to {self.path}: "
+                f"{self._error.__class__.__name__}: {self._error}"
+            )
+
+    def _check(self):
+        # Stop the experiment as soon as rows can't be saved anymore
+        if self._error:
+            raise self._error
+
+    def _run(self):
+        try:
+            # Append, so rows are never lost when a file already exists
+            with open(self.path, "a", newline="") as file:
+                csv_writer = None
+
+                while True:
+                    row = self._queue.get()
+
+                    if row is _STOP:
+                        break
+
+                    if row is _FLUSH:
+                        file.flush()
+                        os.fsync(file.fileno())
+                        continue
+
+                    if csv_writer is None:
+                        csv_writer = csv.DictWriter(file, fieldnames=list(row))
+                        if file.tell() == 0:
+                            csv_writer.writeheader()
+                    csv_writer.writerow(row)
+
+                    # Hand the row to the OS as soon as there's nothing else to do
+                    if self._queue.empty():
+                        file.flush()
+
+                file.flush()
+                os.fsync(file.fileno())
+
+        except Exception as e:
+            self._error = e